@@ -0,0 +1,153 @@
+"""
+Headless weekly run: every store's quick-paste summary row from a folder of exports.
+
+    python batch.py exports/ --ad-spend ad_spend.csv
+    python batch.py exports/ --ad-spend ad_spend.csv --out week.tsv --workers 3
+
+Exports are assigned to stores by name: a CSV inside a sub-folder named after
+the store (exports/rhoms_dc/orders.csv), or one whose file name starts with
+the store (yevivo_ca_2025-06-02.csv, "Rhóms DC week 23.csv"). Several exports
+for one store are merged as in the dashboards.
+
+The ad spend file is a CSV with a `store` column (key or dashboard name) and
+an `ad_spend` column; optional columns set the GBP → USD rate (`fx`) and, for
+Gleamont, the processor fee (`fee_pct`, `fixed_fee`). A store without a row
+gets zero ad spend. Orders in currencies covered by the daily FX table
+(fx_rates.py) convert at its rates instead; orders it has no rate for use
+`fx`.
+
+Each store runs in its own worker process through the dashboards' loaders
+(sidecar cache included) and summary functions, so its row is exactly what
+that dashboard's quick paste gives. All rows are written at once as TSV, one
+per store, with the columns of every store that has exports.
+"""
+import argparse
+import os
+import re
+import sys
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import fx_rates
+import pnl_engine
+import sidecar
+import stores
+
+STORE_NAMES = {**{key: p.name for key, p in stores.PROFILES.items()}, "gleamont": "Gleamont"}
+
+
+def slug(s: str) -> str:
+    s = unicodedata.normalize("NFKD", str(s)).encode("ascii", "ignore").decode("ascii").lower()
+    return "_".join(re.findall(r"[a-z0-9]+", s))
+
+
+# dashboard names as well as keys ("Yevivo Canada" → yevivo_ca), longest first so
+# "rhoms_dc_week" is Rhóms DC rather than Rhóms
+ALIASES = dict(sorted({**{slug(name): key for key, name in STORE_NAMES.items()}, **{k: k for k in STORE_NAMES}}.items(),
+                      key=lambda kv: -len(kv[0])))
+
+
+def store_for(name: str) -> str | None:
+    s = slug(name)
+    return next((key for alias, key in ALIASES.items() if s == alias or s.startswith(alias + "_")), None)
+
+
+def assign_exports(folder: str) -> tuple[dict, list]:
+    """({store key: [paths]}, unassigned paths) for the CSVs under `folder`."""
+    by_store, unassigned = {}, []
+    for root, _, files in os.walk(folder):
+        sub = os.path.relpath(root, folder)
+        for fname in sorted(files):
+            if not fname.lower().endswith(".csv"):
+                continue
+            path = os.path.join(root, fname)
+            key = store_for(sub.split(os.sep)[0]) if sub != "." else None
+            key = key or store_for(os.path.splitext(fname)[0])
+            if key:
+                by_store.setdefault(key, []).append(path)
+            else:
+                unassigned.append(path)
+    return by_store, unassigned
+
+
+def read_ad_spend(path: str) -> dict:
+    """{store key: {"ad_spend": …, "fx": …, …}} from the ad spend CSV."""
+    df = pd.read_csv(path)
+    df.columns = [slug(c) for c in df.columns]
+    if not {"store", "ad_spend"} <= set(df.columns):
+        raise ValueError(f"{path} needs 'store' and 'ad_spend' columns.")
+    out = {}
+    for row in df.to_dict("records"):
+        key = ALIASES.get(slug(row.pop("store")))
+        if key is None:
+            raise ValueError(f"{path}: unknown store in row {row}.")
+        out[key] = {k: float(v) for k, v in row.items() if k in ("ad_spend", "fx", "fee_pct", "fixed_fee") and pd.notna(v)}
+    return out
+
+
+def run_store(key: str, paths: list, spend: dict) -> dict:
+    """The store's summary row, as its dashboard would paste it (values formatted)."""
+    datas = []
+    for path in paths:
+        with open(path, "rb") as fh:
+            datas.append(fh.read())
+    if key == "gleamont":
+        result, _ = sidecar.load_gleamont(datas)
+        result = result.copy()
+        result["Proc Fees"] = stores.gleamont_fees(result["Revenue"], spend.get("fee_pct", 0.0),
+                                                   spend.get("fixed_fee", 0.0))
+        return {k: str(v) for k, v in stores.gleamont_pnl(result, spend.get("ad_spend", 0.0)).items()}
+    profile = stores.PROFILES[key]
+    facts, dmin, dmax, _ = sidecar.load_uploads(datas, profile)
+    row = pnl_engine.store_summary(facts, profile, dmin, dmax, ad_spend_usd=spend.get("ad_spend", 0.0),
+                                   fx=spend.get("fx"), fx_table=fx_rates.default_table())
+    return dict(zip(row, pnl_engine.summary_tsv(row).split("\t")))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("folder", help="folder of Shopify exports")
+    ap.add_argument("--ad-spend", metavar="CSV", help="store,ad_spend[,fx,fee_pct,fixed_fee] per store")
+    ap.add_argument("--out", help="write the TSV here instead of stdout")
+    ap.add_argument("--workers", type=int, help="worker processes (default: one per store, up to the CPU count)")
+    args = ap.parse_args(argv)
+
+    by_store, unassigned = assign_exports(args.folder)
+    for path in unassigned:
+        print(f"skipped {path}: no store in its folder or file name", file=sys.stderr)
+    if not by_store:
+        ap.error(f"no exports for any of {', '.join(STORE_NAMES)} in {args.folder}")
+    try:
+        spend = read_ad_spend(args.ad_spend) if args.ad_spend else {}
+    except (OSError, ValueError) as e:
+        ap.error(str(e))
+    keys = [k for k in STORE_NAMES if k in by_store]
+    for key in keys:
+        if key not in spend:
+            print(f"{STORE_NAMES[key]}: no ad spend given, using 0", file=sys.stderr)
+
+    rows, failed = {}, False
+    workers = args.workers or min(len(keys), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {key: pool.submit(run_store, key, by_store[key], spend.get(key, {})) for key in keys}
+        for key, fut in futures.items():
+            try:
+                rows[key] = fut.result()
+            except (ValueError, KeyError, OSError) as e:
+                print(f"{STORE_NAMES[key]}: failed: {e}", file=sys.stderr)
+                failed = True
+
+    table = pd.DataFrame([{"Store": STORE_NAMES[k], **row} for k, row in rows.items()]).fillna("")
+    tsv = table.to_csv(sep="\t", index=False, lineterminator="\n")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            fh.write(tsv)
+    else:
+        sys.stdout.write(tsv)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
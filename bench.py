@@ -0,0 +1,135 @@
+"""
+Benchmark the profitability pipeline on synthetic Shopify exports.
+
+    python bench.py                              # every store, 10k / 100k / 1M rows
+    python bench.py --rows 100000 --stores rhoms yevivo --out bench.jsonl
+
+Each stage (parse, dates, calc_cogs, revenue/fees, front-end split,
+reconciliation, order cube) is timed on its own; a second pass under tracemalloc records
+the stage's peak traced memory. Results print as a table and, with --out, are
+appended as JSON lines so runs can be compared for regressions.
+"""
+import argparse
+import io
+import json
+import time
+import tracemalloc
+
+import pnl_engine
+import stores
+import synth
+
+DEFAULT_ROWS = [10_000, 100_000, 1_000_000]
+STORE_KEYS = [*stores.PROFILES, "gleamont"]
+
+
+def profile_stages(profile, csv: bytes):
+    """(stage name, fn(state) -> state) pairs for a tier-table store."""
+    cfg = profile.cogs
+
+    def parse(_):
+        return {"df": pnl_engine.read_orders_csv(io.BytesIO(csv), country_cols=cfg.country_cols,
+                                                 date_cols=profile.date_cols, revenue_cols=cfg.revenue_cols)}
+
+    def dates(state):
+        return {**state, "dates": pnl_engine.extract_date_series(state["df"], profile.date_cols)}
+
+    def calc_cogs(state):
+        return {**state, "facts": pnl_engine.order_facts(state["df"], cfg, state["dates"])}
+
+    def revenue_and_fees(state):
+        pnl_engine.revenue_and_fees(state["facts"], profile, profile.fx_default)
+        return state
+
+    def split_frontend(state):
+        return {**state, "front": pnl_engine.frontend(state["facts"])}
+
+    def reconciliation(state):
+        pnl_engine.reconciliation_tables(state["facts"])
+        return state
+
+    def order_cube(state):
+        return {**state, "cube": pnl_engine.OrderCube.from_facts(state["facts"])}
+
+    return [("parse", parse), ("dates", dates), ("calc_cogs", calc_cogs),
+            ("revenue_and_fees", revenue_and_fees), ("split_frontend", split_frontend),
+            ("reconciliation", reconciliation), ("order_cube", order_cube)]
+
+
+def gleamont_stages(csv: bytes):
+    def parse(_):
+        return {"df": stores.read_gleamont_csv(io.BytesIO(csv))}
+
+    def orders(state):
+        return {**state, "facts": stores.gleamont_orders(state["df"])}
+
+    return [("parse", parse), ("calc_cogs", orders)]
+
+
+def run_stages(stages, memory: bool):
+    """[(stage, seconds, peak MiB or None)] for one pass over the stages."""
+    out, state = [], None
+    for name, fn in stages:
+        if memory:
+            tracemalloc.start()
+        t0 = time.perf_counter()
+        state = fn(state)
+        secs = time.perf_counter() - t0
+        peak = None
+        if memory:
+            peak = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+        out.append((name, secs, peak))
+    return out, state
+
+
+def bench_store(key: str, n_rows: int, seed: int, repeat: int, memory: bool):
+    if key == "gleamont":
+        csv = synth.to_csv_bytes(synth.gleamont_export(n_rows, seed))
+        make = lambda: gleamont_stages(csv)
+    else:
+        profile = stores.PROFILES[key]
+        csv = synth.to_csv_bytes(synth.profile_export(profile, n_rows, seed))
+        make = lambda: profile_stages(profile, csv)
+
+    best = None
+    for _ in range(repeat):
+        timings, state = run_stages(make(), memory=False)
+        best = timings if best is None else [min(a, b, key=lambda t: t[1]) for a, b in zip(best, timings)]
+    peaks = [p for _, _, p in run_stages(make(), memory=True)[0]] if memory else [None] * len(best)
+    n_orders = len(state["facts"])
+    return [
+        {"store": key, "rows": n_rows, "orders": n_orders, "stage": name,
+         "seconds": round(secs, 4), "rows_per_sec": round(n_rows / secs) if secs else None,
+         "peak_mib": round(peak, 1) if peak is not None else None}
+        for (name, secs, _), peak in zip(best, peaks)
+    ]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS)
+    ap.add_argument("--stores", nargs="+", default=STORE_KEYS, choices=STORE_KEYS)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--repeat", type=int, default=1, help="keep the best of N timing passes")
+    ap.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    ap.add_argument("--out", help="append results to this JSON-lines file")
+    args = ap.parse_args(argv)
+
+    stamp = time.strftime("%Y-%m-%dT%H:%M:%S")
+    print(f"{'store':<12} {'rows':>9} {'orders':>8} {'stage':<17} {'seconds':>9} {'rows/s':>11} {'peak MiB':>9}")
+    for n_rows in args.rows:
+        for key in args.stores:
+            results = bench_store(key, n_rows, args.seed, args.repeat, memory=not args.no_memory)
+            for r in results:
+                peak = f"{r['peak_mib']:.1f}" if r["peak_mib"] is not None else "–"
+                print(f"{r['store']:<12} {r['rows']:>9} {r['orders']:>8} {r['stage']:<17} "
+                      f"{r['seconds']:>9.4f} {r['rows_per_sec'] or 0:>11,} {peak:>9}")
+            if args.out:
+                with open(args.out, "a", encoding="utf-8") as fh:
+                    for r in results:
+                        fh.write(json.dumps({"run": stamp, **r}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Daily FX table for multi-currency exports.
+
+A CSV we maintain by hand or from the bank's daily rates, one row per
+currency and day:
+
+    date,currency,rate
+    2024-03-01,GBP,1.2634
+    2024-03-01,EUR,1.0821
+
+`rate` is USD per unit of the currency. Orders convert at the latest rate on
+or before their day for their Shopify "Currency" (see pnl_engine.usd_rates).
+Orders the table has no rate for fall back to the dashboard's manual rate;
+the dashboards say how many of those are in another currency than the
+store's.
+
+    PNL_FX_RATES   table file (default fx_rates.csv next to this module;
+                   "off" turns it off)
+"""
+import os
+
+import pandas as pd
+
+import pnl_engine
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fx_rates.csv")
+COLUMNS = ["date", "currency", "rate"]
+
+_loaded = {}
+
+
+def load_table(path: str) -> pd.DataFrame:
+    """The table at `path`: date (datetime64), currency (upper case), rate, sorted by date; bad rows dropped."""
+    raw = pd.read_csv(path, dtype=str, skipinitialspace=True)
+    raw.columns = raw.columns.str.strip().str.lower()
+    missing = [c for c in COLUMNS if c not in raw.columns]
+    if missing:
+        raise ValueError(f"{path}: missing column(s) {', '.join(missing)}")
+    table = pd.DataFrame({
+        "date": pd.to_datetime(raw["date"].str.strip(), format="%Y-%m-%d", errors="coerce"),
+        "currency": raw["currency"].fillna("").str.strip().str.upper(),
+        "rate": pd.to_numeric(raw["rate"], errors="coerce"),
+    })
+    table = table.loc[table["date"].notna() & (table["currency"] != "") & (table["rate"] > 0)]
+    # a day listed twice keeps its last row
+    table = table.drop_duplicates(["date", "currency"], keep="last")
+    return table.sort_values(["date", "currency"], kind="stable").reset_index(drop=True)
+
+
+def default_table() -> pd.DataFrame | None:
+    """The table configured by the environment (re-read when the file changes), or None when it is off or missing."""
+    path = os.environ.get("PNL_FX_RATES", DEFAULT_PATH)
+    if path.lower() == "off":
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    key = (path, st.st_mtime_ns, st.st_size)
+    if key not in _loaded:
+        try:
+            table = load_table(path)
+        except (OSError, ValueError, pd.errors.ParserError):
+            return None
+        _loaded.clear()
+        _loaded[key] = table
+    return _loaded[key]
+
+
+def version(table: pd.DataFrame | None) -> str:
+    """Fingerprint of a table, for caches of figures converted with it ("" without one)."""
+    if table is None:
+        return ""
+    return pnl_engine.table_version(table["date"].dt.strftime("%Y-%m-%d").tolist(), table["currency"].tolist(),
+                                    table["rate"].tolist())
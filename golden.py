@@ -0,0 +1,179 @@
+"""
+Golden-output check: the old per-order loops (legacy.py) against pnl_engine.
+
+    python golden.py                                  # every store, generated 10k-row exports
+    python golden.py --rows 50000 --stores rhoms gleamont
+    python golden.py --csv yevivo=exports/yevivo_anon.csv
+    python golden.py --chunk-rows 5000                # also check chunked reading
+
+For each store both paths price the same export; any order whose main units,
+main cost, extras cost, status or warnings (plus country, unmapped lines and
+total) differ is listed, along with how much faster the engine path is. The
+exit code is non-zero when anything differs, so a store can be switched to a
+new engine only once it comes back clean. With --chunk-rows the streamed
+(chunked) path is checked against the in-memory engine the same way.
+"""
+import argparse
+import io
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import legacy
+import pnl_engine
+import stores
+import synth
+
+STORE_KEYS = [*stores.PROFILES, "gleamont"]
+BREAKDOWN_COLS = [
+    "Date", "Raw Country", "Country", "Main Units", "Main Cost (USD)", "Extras Cost (USD)",
+    "Total COGS (USD)", "Computed?", "Status", "Unmapped Lines", "Warnings",
+]
+GLEAMONT_COLS = ["Region", "Units (incl. gifts)", "Revenue", "COGS", "Warning", "Is Recurring", "Is First Order"]
+
+
+def _timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t0
+
+
+def diff_frames(old: pd.DataFrame, new: pd.DataFrame, key: str, cols) -> pd.DataFrame:
+    """Long table of (key, column, old, new) for every cell that differs, missing orders included."""
+    m = old.merge(new, on=key, how="outer", suffixes=(" (old)", " (new)"), indicator=True)
+    missing = m[m["_merge"] != "both"]
+    out = [pd.DataFrame({
+        key: missing[key], "column": "(order missing)",
+        "old": np.where(missing["_merge"] == "right_only", "", "present"),
+        "new": np.where(missing["_merge"] == "left_only", "", "present"),
+    })]
+    both = m[m["_merge"] == "both"]
+    for c in cols:
+        a, b = both[f"{c} (old)"], both[f"{c} (new)"]
+        if pd.api.types.is_float_dtype(a) or pd.api.types.is_float_dtype(b):
+            bad = ~np.isclose(a.astype(float), b.astype(float), rtol=0, atol=0.005, equal_nan=True)
+        else:
+            bad = a.astype(object).where(a.notna(), "").to_numpy() != b.astype(object).where(b.notna(), "").to_numpy()
+        if bad.any():
+            out.append(pd.DataFrame({key: both.loc[bad, key], "column": c, "old": a[bad], "new": b[bad]}))
+    return pd.concat(out, ignore_index=True)
+
+
+def check_profile(profile, csv: bytes) -> dict:
+    cfg = profile.cogs
+    # legacy path: plain read_csv, as the dashboards did
+    def old_path():
+        df = pd.read_csv(io.BytesIO(csv))
+        ds = legacy.extract_date_series(df, profile.date_cols)
+        total, _ = legacy.calc_cogs(df, cfg)
+        return legacy.per_order_cogs_breakdown(df, ds, cfg), total
+
+    def new_path():
+        facts, _, _ = pnl_engine.load_orders(csv, profile)
+        return facts, pnl_engine.cogs_total(facts)
+
+    (old, old_total), t_old = _timed(old_path)
+    (new, new_total), t_new = _timed(new_path)
+    if old.empty:
+        old = pd.DataFrame(columns=["Order ID", *BREAKDOWN_COLS])
+    return {
+        "orders": len(old), "diffs": diff_frames(old, new, "Order ID", BREAKDOWN_COLS),
+        "totals": (old_total, new_total), "seconds": (t_old, t_new),
+    }
+
+
+def check_gleamont(csv: bytes) -> dict:
+    def old_path():
+        return legacy.gleamont_orders(pd.read_csv(io.BytesIO(csv)))
+
+    def new_path():
+        return stores.gleamont_orders(stores.read_gleamont_csv(io.BytesIO(csv)))
+
+    old, t_old = _timed(old_path)
+    new, t_new = _timed(new_path)
+    return {
+        "orders": len(old),
+        "diffs": diff_frames(old.reset_index(), new.reset_index(), "Order", GLEAMONT_COLS),
+        "totals": (round(float(old["COGS"].sum()), 2), round(float(new["COGS"].sum()), 2)),
+        "seconds": (t_old, t_new),
+    }
+
+
+def check(key: str, csv: bytes) -> dict:
+    return check_gleamont(csv) if key == "gleamont" else check_profile(stores.PROFILES[key], csv)
+
+
+def check_stream(key: str, csv: bytes, chunk_rows: int) -> dict:
+    """In-memory engine (old side) against the same engine over chunks (new side)."""
+    if key == "gleamont":
+        whole, t_old = _timed(lambda: stores.gleamont_orders(stores.read_gleamont_csv(io.BytesIO(csv))))
+        streamed, t_new = _timed(lambda: stores.stream_gleamont(io.BytesIO(csv), chunk_rows))
+        return {
+            "orders": len(whole),
+            "diffs": diff_frames(whole.reset_index(), streamed.reset_index(), "Order", GLEAMONT_COLS),
+            "totals": (round(float(whole["COGS"].sum()), 2), round(float(streamed["COGS"].sum()), 2)),
+            "seconds": (t_old, t_new),
+        }
+    profile = stores.PROFILES[key]
+    (whole, _, _), t_old = _timed(pnl_engine.load_orders, csv, profile)
+    (streamed, agg), t_new = _timed(lambda: pnl_engine.stream_orders(io.BytesIO(csv), profile, chunk_rows=chunk_rows))
+    return {
+        "orders": len(whole), "diffs": diff_frames(whole, streamed, "Order ID", BREAKDOWN_COLS),
+        "totals": (pnl_engine.cogs_total(whole), agg.cogs_total()), "seconds": (t_old, t_new),
+    }
+
+
+def report(label: str, res: dict, show: int, sides=("legacy", "engine")) -> bool:
+    t_old, t_new = res["seconds"]
+    old_total, new_total = res["totals"]
+    diffs = res["diffs"]
+    n_orders = diffs.iloc[:, 0].nunique() if not diffs.empty else 0
+    clean = diffs.empty and abs(old_total - new_total) < 0.005
+    print(f"{label:<28} {res['orders']:>8} orders  {'OK' if clean else 'DIFF':<4}  "
+          f"{n_orders:>6} orders differ  COGS {old_total:,.2f} → {new_total:,.2f}  "
+          f"{sides[0]} {t_old:7.2f}s  {sides[1]} {t_new:6.2f}s  {t_old / t_new if t_new else float('inf'):6.1f}× faster")
+    if abs(old_total - new_total) >= 0.005:
+        print(f"  blended calc_cogs total differs by {new_total - old_total:+,.2f}")
+    if not diffs.empty:
+        print(diffs.groupby("column").size().rename("cells").to_string())
+        print(diffs.head(show).to_string(index=False))
+    return clean
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--rows", type=int, default=10_000, help="rows per generated export")
+    ap.add_argument("--stores", nargs="+", default=STORE_KEYS, choices=STORE_KEYS)
+    ap.add_argument("--seeds", type=int, nargs="+", default=[0])
+    ap.add_argument("--csv", action="append", default=[], metavar="STORE=PATH",
+                    help="also check a (anonymized) real export for a store; repeatable")
+    ap.add_argument("--show", type=int, default=20, help="differing cells to print per run")
+    ap.add_argument("--chunk-rows", type=int, help="also compare chunked reading (this many lines per chunk)")
+    args = ap.parse_args(argv)
+
+    def run(label, key, csv):
+        ok = report(label, check(key, csv), args.show)
+        if args.chunk_rows:
+            ok &= report(f"{label} chunked", check_stream(key, csv, args.chunk_rows), args.show,
+                         sides=("in-memory", "chunked"))
+        return ok
+
+    clean = True
+    for key in args.stores:
+        for seed in args.seeds:
+            df = synth.gleamont_export(args.rows, seed) if key == "gleamont" else \
+                synth.profile_export(stores.PROFILES[key], args.rows, seed)
+            clean &= run(f"{key} (synthetic, seed {seed})", key, synth.to_csv_bytes(df))
+    for spec in args.csv:
+        key, _, path = spec.partition("=")
+        if key not in STORE_KEYS:
+            ap.error(f"unknown store '{key}' in --csv {spec}")
+        with open(path, "rb") as fh:
+            clean &= run(f"{key} ({path})", key, fh.read())
+    return 0 if clean else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+"""
+Reference copies of the per-order loops the dashboards ran before pnl_engine.
+
+They are kept only as the golden side of golden.py: slow, row-by-row and
+deliberately untouched, parameterized by a store profile instead of module
+globals. Don't call these from a dashboard.
+"""
+import re
+import unicodedata
+
+import pandas as pd
+
+import stores
+
+
+def norm(s):
+    s = str(s)
+    s = unicodedata.normalize("NFKD", s).encode("ascii","ignore").decode("ascii").lower()
+    s = re.sub(r"[\W_]+"," ", s)
+    return " ".join(s.split())
+
+
+def main_cost_with_extrapolation(main_cost_table, country: str, main_qty: int):
+    """
+    Returns (cost, warning). If main_qty is above the highest tier, extrapolate using
+    the last step. Example: cost[n] = cost[max] + (n-max)*step.
+    """
+    if not main_qty:
+        return 0.0, None
+
+    tiers = main_cost_table.get(country, {})
+    if not tiers:
+        return 0.0, f"Unknown country '{country}' for main tiers."
+
+    if main_qty in tiers:
+        return float(tiers[main_qty]), None
+
+    max_tier = max(tiers.keys())
+    if main_qty > max_tier:
+        step = (tiers[max_tier] - tiers[max_tier-1]) if (max_tier-1) in tiers else 0
+        est = tiers[max_tier] + step * (main_qty - max_tier)
+        return float(round(est, 2)), f"Extrapolated main COGS for {main_qty} units"
+    return 0.0, f"Missing main tier for {main_qty} units."
+
+
+class _Rules:
+    def __init__(self, cfg):
+        self.cfg = cfg
+
+    def is_main(self, n):
+        return any(alias in n for alias in self.cfg.main_aliases)
+
+    def zero_cogs(self, n):
+        return any(k in n for k in self.cfg.zero_cogs_keys)
+
+    def extra_key(self, n):
+        for key in self.cfg.extra_costs:
+            if key in n: return key
+        return None
+
+    def raw_country(self, grp, country_col):
+        if not country_col:
+            return ""
+        if self.cfg.first_valid_country:
+            # Yevivo: first non-null shipping country in this order
+            s = grp[country_col].dropna().astype(str).str.strip()
+            return s.iloc[0] if not s.empty else ""
+        return str(grp[country_col].iloc[0]).strip()
+
+
+def _country_col(df, cfg):
+    for c in cfg.country_cols:
+        if c in df.columns:
+            return c
+    return None
+
+
+def calc_cogs(df: pd.DataFrame, cfg, debug=False):
+    """The dashboards' old blended calc_cogs: (total, logs)."""
+    if df.empty:
+        return 0.0, []
+    country_col = _country_col(df, cfg)
+    if country_col is None:
+        raise ValueError("No shipping country column found in CSV.")
+    rules = _Rules(cfg)
+
+    df = df.copy()
+    df["qty"] = pd.to_numeric(df["Lineitem quantity"], errors="coerce").fillna(0).astype(int)
+    df["Country"] = df[country_col].map(cfg.country_map).fillna(df[country_col])
+
+    total=0.0; logs=[]
+    for oid, grp in df.groupby("Name"):
+        if cfg.first_valid_country:
+            raw = rules.raw_country(grp, country_col)
+            country = cfg.country_map.get(raw, raw)
+        else:
+            country = str(grp["Country"].iloc[0]).strip()
+        main_qty=0; extras_cost=0.0
+        for _,r in grp.iterrows():
+            n=norm(r["Lineitem name"]); q=int(r["qty"])
+            if q==0 or rules.zero_cogs(n): continue
+            if rules.is_main(n): main_qty += q; continue
+            ek = rules.extra_key(n)
+            if ek:
+                extras_cost += cfg.extra_costs[ek].get(country,0) * q
+            else:
+                logs.append(f"{oid}: Unmapped {r['Lineitem name']}")
+        main_cost, warn = main_cost_with_extrapolation(cfg.main_cost_table, country, main_qty)
+        if debug and warn:
+            logs.append(f"{oid}: {warn}")
+
+        total += main_cost + extras_cost
+        if debug:
+            logs.append(f"{oid} · {country} · main {main_qty}u = ${main_cost:.2f} · extras ${extras_cost:.2f}")
+    return round(total,2), logs
+
+
+def extract_date_series(df: pd.DataFrame, date_cols) -> pd.Series:
+    """Return a parsed datetime series from the first matching date column."""
+    for col in date_cols:
+        if col in df.columns:
+            s = pd.to_datetime(df[col], errors="coerce", utc=False)
+            if s.notna().any():
+                return s
+    # fallback: try any column with 'date' or 'created' in name
+    for col in df.columns:
+        if any(k in col.lower() for k in ("date", "created", "processed")):
+            s = pd.to_datetime(df[col], errors="coerce", utc=False)
+            if s.notna().any():
+                return s
+    return pd.Series(dtype="datetime64[ns]")
+
+
+def per_order_cogs_breakdown(df_all: pd.DataFrame, date_series: pd.Series, cfg):
+    """The dashboards' old _per_order_cogs_breakdown, one row per order."""
+    country_col = _country_col(df_all, cfg)
+    rules = _Rules(cfg)
+
+    rows = []
+    for oid, grp in df_all.groupby("Name"):
+        # Date (first non-null in detected date column)
+        dt = ""
+        if not date_series.empty:
+            try:
+                dtv = pd.to_datetime(date_series.loc[grp.index].dropna().iloc[0])
+                dt = dtv.strftime("%Y-%m-%d")
+            except Exception:
+                dt = ""
+
+        raw_country = rules.raw_country(grp, country_col)
+        norm_country = cfg.country_map.get(raw_country, raw_country)
+        country_known = norm_country in cfg.main_cost_table
+
+        main_qty = 0
+        extras_cost = 0.0
+        unmapped = []
+
+        for _, r in grp.iterrows():
+            q = int(pd.to_numeric(r.get("Lineitem quantity", 0), errors="coerce") or 0)
+            n = norm(r.get("Lineitem name", ""))
+
+            if q == 0 or rules.zero_cogs(n):
+                continue
+
+            if rules.is_main(n):
+                main_qty += q
+                continue
+
+            ek = rules.extra_key(n)
+            if ek:
+                price_map = cfg.extra_costs.get(ek, {})
+                if norm_country in price_map:
+                    extras_cost += price_map[norm_country] * q
+                else:
+                    # extra exists but not priced for this country
+                    unmapped.append(str(r.get("Lineitem name", "")))
+            else:
+                # unknown extra
+                unmapped.append(str(r.get("Lineitem name", "")))
+
+        main_cost, warn = main_cost_with_extrapolation(cfg.main_cost_table, norm_country, main_qty)
+
+        total_cogs = round((main_cost or 0.0) + (extras_cost or 0.0), 2)
+
+        if not country_known:
+            status = "Unknown country"
+            computed = (main_cost > 0) or (extras_cost > 0)
+        elif warn:
+            status = warn
+            computed = (main_cost > 0) or (extras_cost > 0)
+        elif (main_cost > 0) or (extras_cost > 0):
+            status = "OK"
+            computed = True
+        else:
+            status = "Only zero-COGS/unmapped"
+            computed = False
+
+        rows.append({
+            "Order ID": oid,
+            "Date": dt,
+            "Raw Country": raw_country,
+            "Country": norm_country,
+            "Main Units": int(main_qty),
+            "Main Cost (USD)": round(main_cost or 0.0, 2),
+            "Extras Cost (USD)": round(extras_cost or 0.0, 2),
+            "Total COGS (USD)": total_cogs,
+            "Computed?": computed,
+            "Status": status,
+            "Unmapped Lines": ", ".join(unmapped) if unmapped else "",
+            "Warnings": warn or "",
+        })
+
+    return pd.DataFrame(rows)
+
+
+# ------------------------- GLEAMONT (fitted model) -------------------------
+def _detect_region_from_row(row: pd.Series):
+    # Return (region, eu_adjust)
+    code = None
+    for col in stores.GLEAMONT_COUNTRY_COLS:
+        if col in row and pd.notna(row[col]) and str(row[col]).strip():
+            code = str(row[col]).strip().upper()
+            break
+    if code in stores.GLEAMONT_EU_CODES:
+        return ("United Kingdom", True)  # Use UK base + $1
+    if code in stores.GLEAMONT_COUNTRY_CODE_TO_REGION:
+        return (stores.GLEAMONT_COUNTRY_CODE_TO_REGION[code], False)
+    return (None, False)
+
+
+def _compute_cost_for_units(region: str, n_units: int) -> float:
+    if n_units <= 0:
+        return 0.0
+    model = stores.fit_country_model(region)
+    return model.S + model.U * n_units
+
+
+def gleamont_orders(df: pd.DataFrame) -> pd.DataFrame:
+    """The Gleamont dashboard's old per-order loop."""
+    df = df.copy()
+    df["__is_base"] = df["Lineitem name"].astype(str).map(stores.is_base_product)
+
+    # Revenue per order (take 'Total' once per order)
+    order_rev = df.groupby("Name")["Total"].first()
+
+    # Units for base product (sum ALL base and gift variants)
+    units = df[df["__is_base"]].groupby("Name")["Lineitem quantity"].sum().rename("units")
+    units = units.reindex(order_rev.index).fillna(0).astype(int)
+
+    # Country/Region per order
+    region_info = []
+    for name, sub in df.groupby("Name"):
+        row0 = sub.iloc[0]
+        region, eu_adj = _detect_region_from_row(row0)
+        region_info.append((name, region, eu_adj))
+    region_df = pd.DataFrame(region_info, columns=["Name", "region", "eu_adjust"]).set_index("Name")
+    region_df = region_df.reindex(order_rev.index)
+
+    # Tags per order
+    tags = df.groupby("Name")["Tags"].first().fillna("")
+    is_recurring = tags.str.contains("Subscription Recurring Order", case=False, na=False)
+    is_first = tags.str.contains("Subscription First Order", case=False, na=False)
+
+    # Compute COGS per order
+    costs = []
+    warnings = []
+    for name in order_rev.index:
+        reg = region_df.at[name, "region"]
+        eu_adj = bool(region_df.at[name, "eu_adjust"])
+        u = int(units.at[name]) if name in units.index else 0
+        cost = 0.0
+        warn = ""
+        if u > 0 and reg in stores.GLEAMONT_COGS:
+            cost = _compute_cost_for_units(reg, u)
+        elif u > 0 and reg is None:
+            warn = "Unmapped country"
+        elif u == 0:
+            cost = 0.0
+        if eu_adj and u > 0:
+            cost += 1.0
+            warn = (warn + " | " if warn else "") + "EU/NL +$1 applied"
+        costs.append(cost)
+        warnings.append(warn)
+
+    return pd.DataFrame({
+        "Order": order_rev.index,
+        "Region": region_df["region"].values,
+        "Units (incl. gifts)": units.values,
+        "Revenue": order_rev.values,
+        "COGS": costs,
+        "Warning": warnings,
+        "Tags": tags.reindex(order_rev.index).values,
+        "Is Recurring": is_recurring.reindex(order_rev.index).values,
+        "Is First Order": is_first.reindex(order_rev.index).values,
+    }).set_index("Order")
@@ -0,0 +1,1471 @@
+"""
+Columnar P&L engine shared by the profitability dashboards.
+
+Everything that differs between brands (cost tables, aliases, country map,
+currency, fee model) lives in a `StoreProfile` (see stores.py); the engine
+prices all line items of an upload in a handful of column operations instead
+of a Python loop per row, and every dashboard reduces the same per-order facts.
+"""
+import hashlib
+import importlib.util
+import io
+import json
+import logging
+import re
+import os
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from pandas.tseries.api import guess_datetime_format
+
+
+@dataclass(frozen=True)
+class CogsConfig:
+    main_cost_table: dict
+    extra_costs: dict
+    main_aliases: list
+    zero_cogs_keys: list
+    country_map: dict
+    country_cols: list
+    # Rhóms-style dashboards take the first line's mapped country; the Yevivo
+    # dashboards take the first non-empty shipping country of the order.
+    first_valid_country: bool = False
+    revenue_cols: tuple = ("Total", "Total Sales", "Total Price")
+    recurring_tag: str = "Subscription Recurring Order"
+    first_order_tag: str = "Subscription First Order"
+    # unit counts up to here are precomputed in the tier array; above it the
+    # precomputed slope is applied on the fly
+    tier_cap: int = 64
+
+    @cached_property
+    def matcher(self) -> "LineMatcher":
+        return LineMatcher(self.zero_cogs_keys, self.main_aliases, list(self.extra_costs))
+
+    @cached_property
+    def tiers(self) -> "TierTable":
+        return TierTable(self.main_cost_table, cap=self.tier_cap)
+
+
+@dataclass(frozen=True)
+class FeeModel:
+    # Per order: (Stripe/Shopify 2.8% + 30c) + (extra 2% fee), both grossed up 10% for FX/other.
+    pct: float = 0.028
+    fixed: float = 0.3
+    extra_pct: float = 0.02
+    gross_up: float = 1.1
+    # {"Payment Method" value: (pct, fixed)} for gateways charging other rates,
+    # e.g. {"PayPal Express Checkout": (0.0349, 0.49)}; matched like product names
+    gateways: dict = field(default_factory=dict)
+
+    def rates(self, gateway) -> tuple:
+        """(pct, fixed) arrays per value of `gateway`; pct / fixed where it has no rates of its own."""
+        codes, values = _factorize(pd.Series(np.asarray(gateway, dtype=object)))
+        table = dict(zip(norm_names(pd.Series(list(self.gateways), dtype=object)), self.gateways.values()))
+        own = norm_names(pd.Series(values, dtype=object).fillna("")).map(table)
+        pct = own.map(lambda r: r[0], na_action="ignore").fillna(self.pct).to_numpy(dtype=float)
+        fixed = own.map(lambda r: r[1], na_action="ignore").fillna(self.fixed).to_numpy(dtype=float)
+        return pct[codes], fixed[codes]
+
+    def fees(self, revenue_usd, orders=1, gateway=None):
+        """
+        Fees in USD on `revenue_usd` taken over `orders` orders: the fixed fee
+        is charged per order. Elementwise over arrays, e.g. one entry per
+        order or per group of orders paid through one `gateway`.
+        """
+        pct, fixed = self.rates(gateway) if gateway is not None and self.gateways else (self.pct, self.fixed)
+        return ((revenue_usd * pct + fixed * orders) * self.gross_up) + ((revenue_usd * self.extra_pct) * self.gross_up)
+
+
+@dataclass(frozen=True)
+class StoreProfile:
+    key: str
+    name: str
+    cogs: CogsConfig
+    currency: str = "USD"          # store currency; anything else is converted with the FX rate
+    fx_default: float = 1.0        # default store-currency -> USD rate
+    date_cols: tuple = ("Created at", "Created At", "Processed at", "Order Date", "Order Created At")
+    fees: FeeModel = FeeModel()
+
+    @cached_property
+    def dates(self) -> "DateParser":
+        return DateParser(self.date_cols)
+
+
+class LineMatcher:
+    """
+    Zero-COGS keys, main aliases and extra keys compiled into one regex, so a
+    normalized name is scanned once whatever the number of aliases.
+
+    Keys are alternated in precedence order inside a lookahead: at every
+    position the first key that starts there wins, so the lowest key index
+    seen over the whole name is the old "zero-COGS, then main, then the first
+    EXTRA_COSTS key" answer.
+    """
+
+    def __init__(self, zero_keys, main_aliases, extra_keys):
+        self.keys = [*zero_keys, *main_aliases, *extra_keys]
+        self.n_zero = len(zero_keys)
+        self.n_main = len(main_aliases)
+        alternation = "|".join(f"({re.escape(k)})" for k in self.keys)
+        self._rx = re.compile(f"(?=(?:{alternation}))") if self.keys else None
+
+    def match(self, n: str):
+        """(kind, extra_key) for a normalized name; kind is "zero", "main", "extra" or None."""
+        if self._rx is None:
+            return None, None
+        best = min((m.lastindex - 1 for m in self._rx.finditer(n)), default=None)
+        if best is None:
+            return None, None
+        if best < self.n_zero:
+            return "zero", None
+        if best < self.n_zero + self.n_main:
+            return "main", None
+        return "extra", self.keys[best]
+
+
+# ------------------------- HELPERS -------------------------
+def main_cost_with_extrapolation(tiers_by_country: dict, country: str, main_qty: int):
+    """
+    Returns (cost, warning). If main_qty is above the highest tier, extrapolate
+    using the step between the two highest tiers: cost[n] = cost[max] + (n-max)*step.
+    """
+    if not main_qty:
+        return 0.0, None
+
+    tiers = tiers_by_country.get(country, {})
+    if not tiers:
+        return 0.0, f"Unknown country '{country}' for main tiers."
+
+    if main_qty in tiers:
+        return float(tiers[main_qty]), None
+
+    max_tier = max(tiers.keys())
+    if main_qty > max_tier:
+        sorted_keys = sorted(tiers.keys())
+        step = tiers[sorted_keys[-1]] - tiers[sorted_keys[-2]] if len(sorted_keys) > 1 else 0
+        est = tiers[max_tier] + step * (main_qty - max_tier)
+        return float(round(est, 2)), f"Extrapolated main COGS for {main_qty} units"
+    return 0.0, f"Missing main tier for {main_qty} units."
+
+
+class TierTable:
+    """
+    MAIN_COST_TABLE compiled into a dense (country x units) array, so pricing
+    a whole column of orders is one gather. Entries above the top tier hold
+    the extrapolated cost; `warn` holds a warning code per entry.
+    """
+    OK, UNKNOWN_COUNTRY, EXTRAPOLATED, MISSING_TIER = 0, 1, 2, 3
+
+    def __init__(self, tiers_by_country: dict, cap: int = 64):
+        # a country with an empty table prices like an unknown one
+        self.countries = [c for c, t in tiers_by_country.items() if t]
+        self.cap = max([cap, *(max(t) for t in tiers_by_country.values() if t)])
+        n = len(self.countries)
+        self.cost = np.zeros((n, self.cap + 1))
+        self.warn = np.full((n, self.cap + 1), self.MISSING_TIER, dtype=np.int8)
+        self.warn[:, 0] = self.OK
+        self.max_tier = np.zeros(n, dtype=np.int64)
+        self.top_cost = np.zeros(n)
+        self.step = np.zeros(n)
+        for i, country in enumerate(self.countries):
+            tiers = tiers_by_country[country]
+            for units in range(1, self.cap + 1):
+                cost, warn = main_cost_with_extrapolation(tiers_by_country, country, units)
+                self.cost[i, units] = cost
+                self.warn[i, units] = self.OK if warn is None else (
+                    self.EXTRAPOLATED if warn.startswith("Extrapolated") else self.MISSING_TIER)
+            keys = sorted(tiers)
+            self.max_tier[i] = keys[-1]
+            self.top_cost[i] = tiers[keys[-1]]
+            self.step[i] = tiers[keys[-1]] - tiers[keys[-2]] if len(keys) > 1 else 0
+
+    def price(self, country: pd.Series, units: pd.Series):
+        """(cost, warning code) arrays for aligned country / main-unit columns."""
+        ci = pd.Categorical(country, categories=self.countries).codes.astype(np.int64)
+        q = units.to_numpy(dtype=np.int64)
+        known = ci >= 0
+        in_range = known & (q >= 0) & (q <= self.cap)
+
+        cost = np.zeros(len(q))
+        warn = np.where(known | (q == 0), self.OK, self.UNKNOWN_COUNTRY).astype(np.int8)
+        cost[in_range] = self.cost[ci[in_range], q[in_range]]
+        warn[in_range] = self.warn[ci[in_range], q[in_range]]
+
+        above = known & (q > self.cap)
+        if above.any():
+            c = ci[above]
+            est = self.top_cost[c] + self.step[c] * (q[above] - self.max_tier[c])
+            cost[above] = [round(v, 2) for v in est]
+            warn[above] = self.EXTRAPOLATED
+        warn[known & (q < 0)] = self.MISSING_TIER
+        return cost, warn
+
+    @staticmethod
+    def messages(warn: np.ndarray, country: pd.Series, units: pd.Series) -> np.ndarray:
+        """Warning text per order, formatted only where the code is set."""
+        out = np.full(len(warn), "", dtype=object)
+        c = country.astype(str).to_numpy(dtype=object)
+        q = units.astype(str).to_numpy(dtype=object)
+        for code, fmt in (
+            (TierTable.UNKNOWN_COUNTRY, "Unknown country '{c}' for main tiers."),
+            (TierTable.EXTRAPOLATED, "Extrapolated main COGS for {q} units"),
+            (TierTable.MISSING_TIER, "Missing main tier for {q} units."),
+        ):
+            hit = np.flatnonzero(warn == code)
+            out[hit] = [fmt.format(c=c[i], q=q[i]) for i in hit]
+        return out
+
+
+def content_hash(data) -> str:
+    """
+    Cache key for an upload: hash of its bytes, so re-uploads of the same file
+    hit too. A file (see open_upload) is hashed in 1 MiB reads, never copied whole.
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(data).hexdigest()
+    h = hashlib.sha256()
+    src = open_upload(data)
+    while chunk := src.read(2**20):
+        h.update(chunk)
+    src.seek(0)
+    return h.hexdigest()
+
+
+def open_upload(data):
+    """
+    A binary stream over an upload from its start. Uploads are bytes or a
+    seekable binary file, such as Streamlit's UploadedFile, which the loaders
+    read in place instead of copying it out with getvalue().
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return io.BytesIO(data)
+    data.seek(0)
+    return data
+
+
+def upload_size(data) -> int:
+    """Size of an upload (see open_upload) in bytes."""
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return len(data)
+    return data.seek(0, io.SEEK_END)
+
+
+def table_version(*tables) -> str:
+    """Short fingerprint of cost tables / config, so cached results drop when prices change."""
+    return hashlib.sha1(repr(tables).encode("utf-8")).hexdigest()[:12]
+
+
+def to_cents(values) -> np.ndarray:
+    """Money amounts as int64 cents, so their sums are exact whatever the grouping."""
+    return np.rint(np.asarray(values, dtype=float) * 100).astype(np.int64)
+
+
+def money_total(values) -> float:
+    """Exact cent sum of money amounts: the same total however the orders are split or sliced."""
+    return int(to_cents(values).sum()) / 100
+
+
+def find_country_col(df: pd.DataFrame, country_cols) -> str | None:
+    return next((c for c in country_cols if c in df.columns), None)
+
+
+def _factorize(s: pd.Series):
+    """Codes + distinct values of `s`; every kind of missing comes back as NaN ("nan" as text)."""
+    codes, uniques = pd.factorize(s, use_na_sentinel=False)
+    values = np.array(uniques, dtype=object)
+    values[pd.isna(values)] = np.nan
+    return codes, values
+
+
+def map_unique(s: pd.Series, func) -> pd.Series:
+    """
+    `s.map(func)` evaluated once per distinct value and broadcast back. Order
+    exports repeat a few dozen product names / countries over 100k+ rows.
+    """
+    codes, values = _factorize(s)
+    out = np.empty(len(values), dtype=object)
+    for i, v in enumerate(values):
+        out[i] = func(v)
+    return pd.Series(out[codes], index=s.index, dtype=object)
+
+
+def join_per_key(values: pd.Series, keys: pd.Series, sep: str = ", ") -> pd.Series:
+    """
+    `values.groupby(keys).agg(sep.join)` without a Python call per group:
+    the values are stably sorted by key and each group concatenated by one
+    reduceat over the array.
+    """
+    if values.empty:
+        return pd.Series(dtype=object)
+    codes, uniques = pd.factorize(keys)
+    order = np.argsort(codes, kind="stable")
+    codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    pieces = np.full(len(order), sep, dtype=object)
+    pieces[starts] = ""
+    pieces += values.to_numpy(dtype=object)[order]
+    return pd.Series(np.add.reduceat(pieces, starts), index=uniques[codes[starts]], dtype=object)
+
+
+def _stripped(s: pd.Series) -> pd.Series:
+    return map_unique(s, lambda v: str(v).strip())
+
+
+def norm_names(names: pd.Series) -> pd.Series:
+    """Column-wise equivalent of `norm()`: ASCII-fold, lowercase, collapse non-word runs."""
+    return (
+        names.map(str)
+        .str.normalize("NFKD")
+        .str.encode("ascii", "ignore")
+        .str.decode("ascii")
+        .str.lower()
+        .str.replace(r"[\W_]+", " ", regex=True)
+        .str.strip()
+    )
+
+
+def _classify_names(n: pd.Series, cfg: CogsConfig) -> pd.DataFrame:
+    kinds, extras = zip(*map(cfg.matcher.match, n)) if len(n) else ((), ())
+    kinds = np.array(kinds, dtype=object)
+    return pd.DataFrame({
+        "zero": kinds == "zero",
+        "main": kinds == "main",
+        "extra": np.array(extras, dtype=object),
+    })
+
+
+def classify_lines(names: pd.Series, cfg: CogsConfig) -> pd.DataFrame:
+    """
+    Classify every line item. Precedence matches the old per-row helpers:
+    zero-COGS first, then main product, then the first EXTRA_COSTS key found.
+    The string work runs once per distinct product name, then is broadcast.
+    """
+    codes, values = _factorize(names)
+    per_name = _classify_names(norm_names(pd.Series(values, dtype=object)), cfg)
+    return per_name.iloc[codes].set_axis(names.index)
+
+
+# ------------------------- CSV READER -------------------------
+# Shopify exports carry ~70 columns; the engines only need these few.
+LINE_COLS = ["Name", "Lineitem name", "Lineitem quantity", "Lineitem price", "Tags", "Tag", "Payment Method",
+             "Currency", "Refunded Amount", "Discount Amount"]
+CATEGORY_COLS = {"Lineitem name", "Tags", "Tag", "Payment Method", "Currency"}
+NUMERIC_COLS = {"Lineitem quantity", "Lineitem price", "Refunded Amount", "Discount Amount"}
+DATE_KEYWORDS = ("date", "created", "processed")
+LINE_IDENTITY = ["Name", "Lineitem name", "Lineitem quantity", "Lineitem price"]
+CHUNK_ROWS = 200_000                # lines per chunk when streaming an export
+# uploads at least this big are streamed, not read whole (PNL_STREAM_MIN_MB overrides the 256 MiB)
+STREAM_MIN_BYTES = int(float(os.environ.get("PNL_STREAM_MIN_MB", 256)) * 2**20)
+GATEWAY_COL = "Payment Method"
+CURRENCY_COL = "Currency"
+REFUND_COL, DISCOUNT_COL = "Refunded Amount", "Discount Amount"
+# fingerprint of the pruned line layout, for caches of parsed lines
+LINES_VERSION = table_version(LINE_COLS, sorted(CATEGORY_COLS), sorted(NUMERIC_COLS), DATE_KEYWORDS)
+
+
+def order_columns(header, *, country_cols, date_cols=(), revenue_cols=()) -> dict:
+    """
+    Pick the columns the engines read from an export header, mapped to the
+    dtype to load them as ("category", "numeric" or "str"), in file order.
+    """
+    header = list(header)
+    wanted = {c: "numeric" if c in NUMERIC_COLS else "category" if c in CATEGORY_COLS else "str"
+              for c in LINE_COLS if c in header}
+    wanted.update({c: "category" for c in country_cols if c in header})
+    revenue_col = next((c for c in revenue_cols if c in header), None)
+    if revenue_col:
+        wanted[revenue_col] = "numeric"
+    # all candidate date columns + the keyword fallback DateParser scans
+    wanted.update({c: "str" for c in header
+                   if c in date_cols or any(k in str(c).lower() for k in DATE_KEYWORDS)})
+    return {c: wanted[c] for c in header if c in wanted}
+
+
+def _export_columns(src, **kw) -> dict:
+    header = pd.read_csv(src, nrows=0).columns
+    if hasattr(src, "seek"):
+        src.seek(0)
+    return order_columns(header, **kw)
+
+
+def _to_numeric(df: pd.DataFrame, cols: dict) -> pd.DataFrame:
+    for c in (c for c, t in cols.items() if t == "numeric"):
+        df[c] = pd.to_numeric(df[c], errors="coerce", downcast="integer" if c == "Lineitem quantity" else None)
+    return df
+
+
+def read_orders_csv(src, *, country_cols, date_cols=(), revenue_cols=(), engine=None) -> pd.DataFrame:
+    """
+    Read a Shopify order export with only the columns the engines use:
+    categoricals for names/countries/tags, numbers for quantity/price/revenue.
+    Uses pyarrow's multithreaded CSV parser when it is installed.
+    """
+    cols = _export_columns(src, country_cols=country_cols, date_cols=date_cols, revenue_cols=revenue_cols)
+    engine = engine or ("pyarrow" if importlib.util.find_spec("pyarrow") else "c")
+    df = pd.read_csv(
+        src,
+        usecols=list(cols),
+        # "string", not str: pyarrow turns nulls into the text "None" for str
+        dtype={c: ("category" if t == "category" else "string") for c, t in cols.items() if t != "numeric"},
+        engine=engine,
+    )
+    return _to_numeric(df, cols)
+
+
+def map_threads(fn, items) -> list:
+    """`[fn(x) for x in items]` on a thread pool; the CSV parsers release the GIL."""
+    if len(items) <= 1:
+        return [fn(x) for x in items]
+    with ThreadPoolExecutor(max_workers=min(len(items), os.cpu_count() or 1)) as pool:
+        return list(pool.map(fn, items))
+
+
+def _concat_lines(frames) -> pd.DataFrame:
+    frames = list(frames)
+    for c in {c for f in frames for c in f.columns if isinstance(f[c].dtype, pd.CategoricalDtype)}:
+        # one shared category set per column, or concat falls back to object
+        cats = union_categoricals([f[c].astype("category") for f in frames if c in f.columns],
+                                  ignore_order=True).categories
+        frames = [f.assign(**{c: f[c].astype(pd.CategoricalDtype(cats))}) if c in f.columns else f
+                  for f in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+def merge_lines(frames) -> tuple[pd.DataFrame, int]:
+    """
+    Stack the parsed line items of several, possibly overlapping, exports:
+    (merged lines, duplicate lines dropped). A line is a duplicate when an
+    earlier file already has the same order Name and the same line item
+    (LINE_IDENTITY, plus which repeat of that line within the order it is, so
+    an order with two identical lines keeps both). Rows are hashed and
+    de-duplicated in one pass, not compared file against file.
+    """
+    frames = list(frames)
+    if len(frames) == 1:
+        return frames[0], 0
+    keys = []
+    for f in frames:
+        ident = f.reindex(columns=LINE_IDENTITY)
+        ident = ident.astype({c: float if c in NUMERIC_COLS else object for c in LINE_IDENTITY})
+        ident["#"] = ident.groupby(LINE_IDENTITY, dropna=False).cumcount()
+        keys.append(pd.util.hash_pandas_object(ident, index=False).to_numpy())
+    dup = pd.Series(np.concatenate(keys)).duplicated().to_numpy()
+    df = _concat_lines(frames)
+    return df.loc[~dup].reset_index(drop=True), int(dup.sum())
+
+
+def iter_order_chunks(src, *, country_cols, date_cols=(), revenue_cols=(), chunk_rows=None):
+    """
+    Read an export `chunk_rows` lines at a time (default CHUNK_ROWS), yielding
+    frames that hold whole orders only. Shopify writes an order's line items
+    together, so just the last order of a chunk can continue in the next one:
+    its rows are held back and prepended to the next chunk.
+    """
+    cols = _export_columns(src, country_cols=country_cols, date_cols=date_cols, revenue_cols=revenue_cols)
+    reader = pd.read_csv(
+        src,
+        usecols=list(cols),
+        # plain strings: per-chunk categoricals would not concat with the carried rows
+        dtype={c: "string" for c, t in cols.items() if t != "numeric"},
+        chunksize=chunk_rows or CHUNK_ROWS,
+    )
+    carry = None
+    with reader:
+        for chunk in reader:
+            if chunk.empty:
+                continue
+            chunk = _to_numeric(chunk, cols)
+            if carry is not None:
+                chunk = pd.concat([carry, chunk])
+            # rows without a Name are dropped by the engines, so they never end an order
+            named = chunk["Name"].dropna().to_numpy()
+            pos = np.flatnonzero(chunk["Name"].notna().to_numpy())
+            brk = pos[named != named[-1]] if len(named) else pos
+            cut = brk[-1] + 1 if len(brk) else 0
+            carry = chunk.iloc[cut:] if cut < len(chunk) else None
+            if cut:
+                yield chunk.iloc[:cut]
+    if carry is not None:
+        yield carry
+
+
+# ------------------------- ENGINE -------------------------
+FACT_COLUMNS = [
+    "Order ID", "Date", "Raw Country", "Country", "Main Units",
+    "Main Cost (USD)", "Extras Cost (USD)", "Total COGS (USD)",
+    "Computed?", "Status", "Unmapped Lines", "Warnings", "Recurring", "First Order", "Gateway", "Currency",
+    "Revenue",
+]
+# bump whenever order_facts computes a column differently (2: revenue once per order, net of refunds and
+# discounts), so facts cached by an older build are rebuilt even when their layout is unchanged
+FACTS_REVISION = 2
+# fingerprint of the facts layout, how they are computed and the lines they are built from, for caches of built facts
+FACTS_VERSION = table_version(FACT_COLUMNS, FACTS_REVISION, LINES_VERSION)
+
+
+RECON_UNPRICED_COLS = [
+    "Order ID", "Date", "Raw Country", "Country", "Main Units",
+    "Main Cost (USD)", "Extras Cost (USD)", "Total COGS (USD)", "Status", "Unmapped Lines",
+]
+RECON_WARNING_COLS = [
+    "Order ID", "Date", "Country", "Main Units",
+    "Main Cost (USD)", "Extras Cost (USD)", "Total COGS (USD)", "Status", "Warnings",
+]
+RECON_COUNTRY_COLS = [
+    "Order ID", "Date", "Main Units",
+    "Main Cost (USD)", "Extras Cost (USD)", "Total COGS (USD)", "Status", "Unmapped Lines",
+]
+
+
+def _tag_col(df: pd.DataFrame) -> str | None:
+    return "Tags" if "Tags" in df.columns else ("Tag" if "Tag" in df.columns else None)
+
+
+def _amounts(df: pd.DataFrame, col: str) -> np.ndarray:
+    """A money column as floats, NaN where blank (or everywhere when the export lacks it)."""
+    if col not in df.columns:
+        return np.full(len(df), np.nan)
+    return pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+
+
+def _revenue_parts(df: pd.DataFrame, revenue_cols) -> dict:
+    """
+    {column: (per-line values, per-order reduction)} for order revenue: the
+    first of `revenue_cols` in the export, taken once per order (Shopify
+    repeats or blanks order totals on follow-up lines, so summing rows
+    overcounts), else the line items' price x quantity. Order totals are
+    already net of discounts; line items are not, so only they lose the
+    order's "Discount Amount". Both lose its "Refunded Amount".
+    """
+    revenue_col = next((c for c in revenue_cols if c in df.columns), None)
+    if revenue_col:
+        gross = (_amounts(df, revenue_col), "first")
+        discount = (np.full(len(df), np.nan), "first")
+    else:
+        qty = pd.to_numeric(df.get("Lineitem quantity", 0), errors="coerce")
+        gross = (np.nan_to_num(_amounts(df, "Lineitem price") * np.asarray(qty, dtype=float)), "sum")
+        discount = (_amounts(df, DISCOUNT_COL), "first")
+    return {"Gross": gross, "Discount": discount, "Refunded": (_amounts(df, REFUND_COL), "first")}
+
+
+def _order_revenue(per_order: pd.DataFrame) -> np.ndarray:
+    """Order revenue from the per-order reductions of _revenue_parts(), rounded to cents."""
+    parts = per_order[["Gross", "Discount", "Refunded"]].fillna(0.0).to_numpy(dtype=float)
+    return np.round(parts[:, 0] - parts[:, 1] - parts[:, 2], 2)
+
+
+def order_facts(df: pd.DataFrame, cfg: CogsConfig, date_series: pd.Series | None = None) -> pd.DataFrame:
+    """
+    One row per order (sorted by order Name) with everything the dashboards
+    show: country, main units and cost, extras cost, reconciliation status,
+    recurring flag, first order date, payment gateway, currency and revenue
+    in that currency ("" currency: the store's), net of refunds and discounts
+    (see _revenue_parts).
+
+    Blended, NC and reconciliation views are all plain reductions over this.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=FACT_COLUMNS)
+    country_col = find_country_col(df, cfg.country_cols)
+    if country_col is None:
+        raise ValueError("No shipping country column found in CSV.")
+
+    lines = df.loc[df["Name"].notna()]
+    # one sorted factorization of the order Names: every per-order reduction
+    # below groups on these integer codes, and the Names go back on at the end
+    oid, order_ids = pd.factorize(lines["Name"], sort=True)
+    by_order = lines.groupby(oid)
+    qty = pd.to_numeric(lines["Lineitem quantity"], errors="coerce").fillna(0).astype(int)
+
+    # one country per order: first line's country, or first non-empty one
+    if cfg.first_valid_country:
+        raw = by_order[country_col].first()
+        raw_country = _stripped(raw).where(raw.notna(), "")
+    else:
+        first = ~pd.Series(oid).duplicated().to_numpy()
+        raw_country = _stripped(lines.loc[first, country_col]).set_axis(oid[first]).sort_index()
+    country = raw_country.map(cfg.country_map).fillna(raw_country)
+    row_country = pd.Series(country.to_numpy()[oid], index=lines.index)
+
+    # classify + price every line
+    cls = classify_lines(lines["Lineitem name"], cfg)
+    active = (qty != 0).to_numpy() & ~cls["zero"].to_numpy()
+    is_main = active & cls["main"].to_numpy()
+    is_extra = active & ~is_main & cls["extra"].notna().to_numpy()
+
+    unit_price = np.full(len(lines), np.nan)
+    for key, by_country in cfg.extra_costs.items():
+        hit = is_extra & (cls["extra"] == key).to_numpy()
+        if hit.any():
+            unit_price[hit] = row_country[hit].map(by_country).to_numpy(dtype=float)
+    # unknown lines and extras without a price for the order's country
+    unmapped = active & ~is_main & np.isnan(unit_price)
+
+    # line sums and order-level amounts in one grouped pass
+    q = qty.to_numpy()
+    parts = {
+        "Main Units": (np.where(is_main, q, 0), "sum"),
+        "Extras Cost (USD)": (np.where(is_extra & ~unmapped, unit_price * q, 0.0), "sum"),
+        **_revenue_parts(lines, cfg.revenue_cols),
+    }
+    sums = pd.DataFrame({k: v for k, (v, _) in parts.items()}, index=lines.index).groupby(oid).agg(
+        {k: how for k, (_, how) in parts.items()})
+
+    facts = pd.DataFrame({"Raw Country": raw_country, "Country": country}).join(
+        sums[["Main Units", "Extras Cost (USD)"]])
+    facts["Revenue"] = _order_revenue(sums)
+
+    # one gather over the compiled tier array prices every order
+    main_cost, warn_code = cfg.tiers.price(facts["Country"], facts["Main Units"])
+    warn = TierTable.messages(warn_code, facts["Country"], facts["Main Units"])
+
+    extras_cost = facts["Extras Cost (USD)"].to_numpy()
+    facts["Main Cost (USD)"] = np.round(main_cost, 2)
+    facts["Extras Cost (USD)"] = np.round(extras_cost, 2)
+    facts["Total COGS (USD)"] = np.round(main_cost + extras_cost, 2)
+
+    computed = (main_cost > 0) | (extras_cost > 0)
+    known = facts["Country"].isin(list(cfg.main_cost_table)).to_numpy()
+    facts["Computed?"] = computed
+    facts["Status"] = np.select(
+        [~known, warn_code != TierTable.OK, computed],
+        ["Unknown country", warn, "OK"],
+        "Only zero-COGS/unmapped",
+    )
+    facts["Warnings"] = warn
+
+    names = map_unique(lines.loc[unmapped, "Lineitem name"], str)
+    facts["Unmapped Lines"] = join_per_key(names, pd.Series(oid[unmapped])).reindex(facts.index, fill_value="")
+
+    tag_col = _tag_col(lines)
+    if tag_col is None:
+        facts["Recurring"] = facts["First Order"] = False
+    else:
+        tags = lines[tag_col].astype(str)
+        facts["Recurring"] = tags.str.contains(cfg.recurring_tag, case=False, na=False).groupby(oid).any()
+        facts["First Order"] = tags.str.contains(cfg.first_order_tag, case=False, na=False).groupby(oid).any()
+
+    # order-level fields: Shopify only fills them on the order's first line
+    for col, name in ((GATEWAY_COL, "Gateway"), (CURRENCY_COL, "Currency")):
+        facts[name] = ""
+        if col in lines.columns:
+            first_value = by_order[col].first()
+            facts[name] = _stripped(first_value).where(first_value.notna(), "")
+    facts["Currency"] = facts["Currency"].str.upper()
+
+    facts["Date"] = ""
+    if date_series is not None and not date_series.empty:
+        first_dt = date_series.loc[lines.index].groupby(oid).first()
+        facts["Date"] = format_days(first_dt)
+
+    return facts.set_axis(order_ids).rename_axis("Order ID").reset_index()[FACT_COLUMNS]
+
+
+def cogs_total(facts: pd.DataFrame) -> float:
+    return money_total(facts["Total COGS (USD)"])
+
+
+def frontend(facts: pd.DataFrame) -> pd.DataFrame:
+    """NC (new customer) orders: everything not tagged as a recurring subscription."""
+    return facts.loc[~facts["Recurring"].astype(bool)]
+
+
+def order_types(facts: pd.DataFrame) -> np.ndarray:
+    """"recurring", "first" (subscription first order) or "one-off" per order."""
+    recurring = facts["Recurring"].astype(bool).to_numpy()
+    first = facts["First Order"].astype(bool).to_numpy()
+    return np.select([recurring, first], ["recurring", "first"], "one-off")
+
+
+def debug_logs(facts: pd.DataFrame) -> list:
+    """Per-order COGS breakdown lines for the debug expander."""
+    logs = []
+    for oid, country, units, main_cost, extras_cost, warn, unmapped in zip(
+        facts["Order ID"], facts["Country"], facts["Main Units"], facts["Main Cost (USD)"],
+        facts["Extras Cost (USD)"], facts["Warnings"], facts["Unmapped Lines"],
+    ):
+        if unmapped:
+            logs.append(f"{oid}: Unmapped {unmapped}")
+        if warn:
+            logs.append(f"{oid}: {warn}")
+        logs.append(f"{oid} · {country} · main {units}u = ${main_cost:.2f} · extras ${extras_cost:.2f}")
+    return logs
+
+
+def calc_cogs(df: pd.DataFrame, cfg: CogsConfig, debug=False):
+    facts = order_facts(df, cfg)
+    logs = debug_logs(facts) if debug else [
+        f"{oid}: Unmapped {u}" for oid, u in zip(facts["Order ID"], facts["Unmapped Lines"]) if u
+    ]
+    return cogs_total(facts), logs
+
+
+
+def reconciliation_tables(facts: pd.DataFrame, per_country: bool = True, cube: "OrderCube | None" = None) -> dict:
+    """
+    The tables behind the dashboards' Reconciliation section: order counts,
+    unpriced orders, orders per country, warnings and (optionally) the
+    per-country views. The counts come from `cube` (the same orders' cube)
+    when given.
+    """
+    computed = facts["Computed?"]
+    cube = cube or OrderCube.from_facts(facts)
+    country_counts = cube.country_counts()
+    per_country = [
+        (str(ctry), int(cnt), facts.loc[facts["Country"] == str(ctry), RECON_COUNTRY_COLS].sort_values(["Date", "Order ID"]))
+        for ctry, cnt in zip(country_counts["Country"], country_counts["Orders"])
+    ] if per_country else []
+    return {
+        "total_orders": cube.orders,
+        "computed_orders": int(cube.total("Computed")),
+        "unpriced": facts.loc[~computed, RECON_UNPRICED_COLS].sort_values(["Country", "Date", "Order ID"]),
+        "country_counts": country_counts,
+        "warnings": facts.loc[facts["Warnings"] != "", RECON_WARNING_COLS].sort_values(["Country", "Date", "Order ID"]),
+        "per_country": per_country,
+    }
+
+
+# ------------------------- PROFIT -------------------------
+def revenue_and_fees(facts: pd.DataFrame, profile: StoreProfile, fx: float = 1.0, fx_table=None):
+    """
+    (revenue in the store's currency, revenue USD, fees USD, net after fees
+    USD), rounded to cents. See usd_totals for how orders convert; the first
+    figure only counts orders in the store's currency (revenue_by_currency
+    has them all).
+    """
+    if facts.empty:
+        return 0.0, 0.0, 0.0, 0.0
+    return _revenue_and_fees(_fact_rows(facts, fx_table), profile, fx)
+
+
+def _fact_rows(facts: pd.DataFrame, fx_table=None) -> pd.DataFrame:
+    """usd_totals rows of per-order facts, one per order."""
+    day = pd.to_datetime(facts["Date"], format="%Y-%m-%d", errors="coerce")
+    return pd.DataFrame({
+        "Gateway": facts["Gateway"].to_numpy(),
+        "Currency": facts["Currency"].to_numpy(),
+        "FX Rate": usd_rates(day, facts["Currency"], fx_table),
+        "Revenue": to_cents(facts["Revenue"]),
+        "Orders": 1,
+    })
+
+
+def revenue_by_currency(rows: pd.DataFrame, profile: StoreProfile) -> pd.Series:
+    """
+    Revenue as exported per currency of usd_totals `rows` (or per-order
+    facts), largest first; orders without a currency count as the store's.
+    """
+    if "FX Rate" not in rows.columns:
+        rows = _fact_rows(rows)
+    currency = rows["Currency"].replace("", profile.currency)
+    cents = rows["Revenue"].groupby(currency.to_numpy()).sum()
+    return (cents[cents != 0] / 100).sort_values(ascending=False)
+
+
+def unconverted_orders(rows: pd.DataFrame, profile: StoreProfile, by: str = "Currency") -> pd.Series:
+    """
+    Orders of usd_totals `rows` in a currency other than the store's that the
+    FX table has no rate for (so converted at the manual rate), per value of
+    column `by`.
+    """
+    missing = rows.loc[rows["FX Rate"].isna() & ~rows["Currency"].isin(["", profile.currency])]
+    return missing["Orders"].groupby(missing[by].to_numpy()).sum().astype(int)
+
+
+def _fallback_rates(rows: pd.DataFrame, profile: StoreProfile, fx: float) -> np.ndarray:
+    """The rows' FX rates, with the manual rate where the table has none."""
+    rate = rows["FX Rate"].to_numpy(dtype=float)
+    return np.where(np.isnan(rate), usd_rate(profile, fx), rate)
+
+
+def usd_rate(profile: StoreProfile, fx: float) -> float:
+    """The manual rate: `fx` for a non-USD store, 1 for a USD one."""
+    return fx if profile.currency != "USD" else 1.0
+
+
+def usd_rates(day: pd.Series, currency: pd.Series, fx_table: pd.DataFrame | None) -> np.ndarray:
+    """
+    USD per unit of each order's currency on its day: the latest rate on or
+    before the day in `fx_table` (date, currency, rate; see fx_rates.py),
+    found with one as-of merge. 1 for USD; NaN where the table has none or
+    the export had no currency (see usd_totals for what happens to those).
+    """
+    currency = pd.Series(np.asarray(currency, dtype=object)).fillna("").astype(str)
+    out = np.where(currency.to_numpy() == "USD", 1.0, np.nan)
+    if fx_table is None or fx_table.empty:
+        return out
+    day = pd.Series(pd.to_datetime(np.asarray(day)), dtype="datetime64[ns]")
+    ask = pd.DataFrame({"date": day, "currency": currency, "row": np.arange(len(out))})
+    ask = ask.loc[ask["date"].notna() & ~ask["currency"].isin(["", "USD"])].sort_values("date", kind="stable")
+    if ask.empty:
+        return out
+    hit = pd.merge_asof(ask, fx_table, on="date", by="currency", direction="backward")
+    out[hit["row"].to_numpy()] = hit["rate"].to_numpy(dtype=float)
+    return out
+
+
+def order_fees(profile: StoreProfile, revenue_usd, orders, gateway) -> np.ndarray:
+    """FeeModel fees in USD for groups of orders of one gateway each: one array pass however many are grouped."""
+    return np.asarray(profile.fees.fees(np.asarray(revenue_usd, dtype=float), np.asarray(orders, dtype=float),
+                                        gateway), dtype=float)
+
+
+def usd_totals(rows: pd.DataFrame, profile: StoreProfile, fx: float, by: str | None = None) -> pd.DataFrame:
+    """
+    Revenue in the store's currency and revenue and fees in USD of `rows`
+    (Gateway, Currency, FX Rate, Revenue in cents, Orders), per value of
+    column `by` or in total. Exact cent totals are converted once per FX rate
+    and priced once per gateway and rate, so any split of the same orders
+    gives the same figures.
+
+    Orders the FX table has no rate for convert at the manual rate `fx`, so
+    every order counts; unconverted_orders() counts those in a currency other
+    than the store's, for which that rate is only a stand-in.
+    """
+    store = rows["Currency"].isin(["", profile.currency])
+    rows = rows.assign(**{"FX Rate": _fallback_rates(rows, profile, fx)})
+    key = (rows[by] if by else pd.Series(0, index=rows.index)).rename("_key")
+    keys = pd.Index(key.unique()).sort_values()
+    per_rate = rows.groupby([key, "FX Rate"])["Revenue"].sum().reset_index()
+    per_gateway = rows.groupby([key, "Gateway", "FX Rate"])[["Revenue", "Orders"]].sum().reset_index()
+    fees = order_fees(profile, per_gateway["Revenue"] / 100 * per_gateway["FX Rate"], per_gateway["Orders"],
+                      per_gateway["Gateway"])
+    return pd.DataFrame({
+        "Revenue": rows.loc[store, "Revenue"].groupby(key[store]).sum() / 100,
+        "Revenue (USD)": (per_rate["Revenue"] / 100 * per_rate["FX Rate"]).groupby(per_rate["_key"]).sum(),
+        "Fees (USD)": pd.Series(fees).groupby(per_gateway["_key"]).sum(),
+    }).reindex(keys, fill_value=0.0).fillna(0.0).rename_axis(by)
+
+
+def _revenue_and_fees(rows: pd.DataFrame, profile: StoreProfile, fx: float):
+    """revenue_and_fees() over usd_totals rows."""
+    total = usd_totals(rows, profile, fx).reindex([0], fill_value=0.0).iloc[0]
+    revenue, revenue_usd, fees_usd = float(total["Revenue"]), float(total["Revenue (USD)"]), float(total["Fees (USD)"])
+    net_after_fees_usd = revenue_usd - fees_usd
+    return round(revenue, 2), round(revenue_usd, 2), round(fees_usd, 2), round(net_after_fees_usd, 2)
+
+
+SUMMARY_COLS = ["Date (or range)", "Total Revenue (USD)", "Ad Spend (USD)", "Total COGs (USD)",
+                "Total Profit (USD)", "NC Profit (USD)"]
+
+
+def summary_row(date_text: str, net_after_fees: float, ad_spend_usd: float, total_cogs_usd: float,
+                overall_profit: float, fe_overall_profit: float) -> dict:
+    """The one-row quick-paste summary, in the column order of the Sheets."""
+    return dict(zip(SUMMARY_COLS, [
+        date_text,
+        round(net_after_fees, 2),   # net after Shopify fees
+        round(ad_spend_usd, 2),
+        round(total_cogs_usd, 2),
+        round(overall_profit, 2),
+        round(fe_overall_profit, 2),
+    ]))
+
+
+def summary_tsv(row: dict) -> str:
+    """A summary_row as the tab-separated line pasted into Sheets."""
+    values = list(row.values())
+    return "\t".join([values[0]] + [f"{v:.2f}" for v in values[1:]])
+
+
+def store_summary(facts: pd.DataFrame, profile: StoreProfile, dmin, dmax, *,
+                  ad_spend_usd: float = 0.0, fx: float | None = None, fx_table=None) -> dict:
+    """summary_row for one store's facts, from its order cube with the same arithmetic as the dashboards' MAIN CALC."""
+    fx = profile.fx_default if fx is None else fx
+    cube = OrderCube.from_facts(facts, fx_table)
+    total_cogs_usd = cube.cogs_total()
+    _, revenue_usd, fees_usd, net_after_fees = cube.revenue_and_fees(profile, fx)
+    overall_profit = revenue_usd - fees_usd - total_cogs_usd - ad_spend_usd
+
+    front = cube.frontend()
+    fe_cogs_usd = front.cogs_total()
+    _, fe_revenue_usd, fe_fees_usd, _ = front.revenue_and_fees(profile, fx)
+    fe_overall_profit = fe_revenue_usd - fe_fees_usd - fe_cogs_usd - ad_spend_usd
+    return summary_row(pretty_range(dmin, dmax), net_after_fees, ad_spend_usd, total_cogs_usd,
+                       overall_profit, fe_overall_profit)
+
+
+SERIES_COLS = ["Orders", "Revenue (USD)", "Fees (USD)", "Total Revenue (USD)", "Ad Spend (USD)",
+               "Total COGs (USD)", "NC Revenue (USD)", "Total Profit (USD)", "NC Profit (USD)"]
+
+
+def pnl_series(cube: "OrderCube", profile: StoreProfile, fx: float = 1.0, freq: str = "D",
+               ad_spend=0.0) -> pd.DataFrame:
+    """
+    The summary broken down per day (`freq` "D") or ISO week ("W"): revenue,
+    fees, COGS, NC revenue and profit summed from the order cube. Days without
+    orders are kept so the rows line up with a calendar. `ad_spend` is a USD
+    total spread evenly over those days, or a Series of USD per day. Orders
+    without a date are left out.
+    """
+    days = cube.days
+    cols = ["Orders", "Total COGS (USD)"]
+    per_day = cube.by_day(cols).join(cube.frontend().by_day(cols[1:]).reindex(days, fill_value=0), rsuffix=" NC")
+    per_day.columns = ["Orders", "COGS", "NC COGS"]
+    # revenue and fees per order, same model as the one-row summary
+    usd, nc_usd = cube.usd_by_day(profile, fx), cube.frontend().usd_by_day(profile, fx).reindex(days, fill_value=0.0)
+    per_day["Revenue"], per_day["Fees"] = usd["Revenue (USD)"].to_numpy(), usd["Fees (USD)"].to_numpy()
+    per_day["NC Revenue"], per_day["NC Fees"] = nc_usd["Revenue (USD)"].to_numpy(), nc_usd["Fees (USD)"].to_numpy()
+    if isinstance(ad_spend, pd.Series):
+        per_day["Ad Spend"] = ad_spend.reindex(days, fill_value=0.0).astype(float).to_numpy()
+    else:
+        # cent-rounded shares that still add up to the total
+        per_day["Ad Spend"] = np.diff(np.round(np.linspace(0.0, ad_spend, len(days) + 1), 2))
+
+    if freq == "W":
+        iso = days.isocalendar()
+        label = ("Week", iso["year"].astype(str) + "-W" + iso["week"].map("{:02d}".format))
+        per_day = per_day.groupby(label[1].to_numpy(), sort=True).sum()
+    else:
+        label = ("Date", days.strftime("%Y-%m-%d"))
+        per_day.index = label[1]
+
+    fees, nc_fees = per_day["Fees"], per_day["NC Fees"]
+    out = pd.DataFrame({
+        "Orders": per_day["Orders"].astype(int),
+        "Revenue (USD)": per_day["Revenue"],
+        "Fees (USD)": fees,
+        "Total Revenue (USD)": per_day["Revenue"] - fees,
+        "Ad Spend (USD)": per_day["Ad Spend"],
+        "Total COGs (USD)": per_day["COGS"],
+        "NC Revenue (USD)": per_day["NC Revenue"],
+        "Total Profit (USD)": per_day["Revenue"] - fees - per_day["COGS"] - per_day["Ad Spend"],
+        "NC Profit (USD)": per_day["NC Revenue"] - nc_fees - per_day["NC COGS"] - per_day["Ad Spend"],
+    }, columns=SERIES_COLS)
+    return out.round(2).rename_axis(label[0]).reset_index()
+
+
+def series_tsv(table: pd.DataFrame) -> str:
+    """A pnl_series table as a tab-separated block (header + one line per period) for Sheets."""
+    return table.to_csv(sep="\t", index=False, float_format="%.2f", lineterminator="\n")
+
+
+# ------------------------- DATES -------------------------
+def pretty_range(dmin: pd.Timestamp, dmax: pd.Timestamp) -> str:
+    if pd.isna(dmin) or pd.isna(dmax):
+        return "No dates found"
+    dmin = pd.to_datetime(dmin)
+    dmax = pd.to_datetime(dmax)
+    if dmin.date() == dmax.date():
+        return dmin.strftime("%b %d, %Y")
+    if dmin.year == dmax.year:
+        if dmin.month == dmax.month:
+            return f"{dmin.strftime('%b %d')} → {dmax.strftime('%d, %Y')}"
+        return f"{dmin.strftime('%b %d')} → {dmax.strftime('%b %d, %Y')}"
+    return f"{dmin.strftime('%b %d, %Y')} → {dmax.strftime('%b %d, %Y')}"
+
+
+def _to_datetime(values: pd.Index, fmt: str | None) -> pd.Index:
+    """
+    pd.to_datetime(values, errors="coerce", format=fmt). Offsets (%z) are
+    slow to parse value by value, so when every value ends in the same one
+    (Shopify's " +0000") the rest is parsed without it and the offset
+    applied once.
+    """
+    dated = values[values.notna()]
+    if fmt and fmt.endswith("%z") and len(dated) > 1:
+        base = fmt[:-2]
+        sep = base[len(base.rstrip()):]
+        m = re.search(rf"{re.escape(sep)}(Z|[+-]\d\d:?\d\d)$", str(dated[0]))
+        if m and dated.str.endswith(m.group(0)).all():
+            tz = pd.to_datetime(dated[0], format=fmt).tz
+            naive = pd.to_datetime(values.str.slice(0, -len(m.group(0))), errors="coerce", format=base.rstrip())
+            return naive.tz_localize(tz)
+    return pd.to_datetime(values, errors="coerce", utc=False, format=fmt)
+
+
+def parse_timestamps(values: pd.Series, fmt: str | None = None) -> pd.Series:
+    """
+    pd.to_datetime(values, errors="coerce", format=fmt) evaluated once per
+    distinct string and broadcast back: exports repeat each order's timestamp
+    on its lines.
+    """
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    parsed = _to_datetime(pd.Index(uniques, dtype=object), fmt)
+    return pd.Series(parsed.take(codes), index=values.index, name=values.name)
+
+
+def format_days(dt: pd.Series) -> pd.Series:
+    """
+    `dt.dt.strftime("%Y-%m-%d").fillna("")` in one vectorized pass: the
+    (wall-clock) day of each value, "" where there is none.
+    """
+    if isinstance(dt.dtype, pd.DatetimeTZDtype):
+        dt = dt.dt.tz_localize(None)
+    elif not pd.api.types.is_datetime64_dtype(dt.dtype):
+        # mixed offsets stay objects: format once per distinct value
+        return map_unique(dt, lambda v: "" if pd.isna(v) else v.strftime("%Y-%m-%d"))
+    days = dt.to_numpy("datetime64[D]")
+    out = np.datetime_as_string(days, unit="D").astype(object)
+    out[np.isnat(days)] = ""
+    return pd.Series(out, index=dt.index, dtype=object)
+
+
+def _first_value(s: pd.Series) -> str | None:
+    i = s.first_valid_index()
+    return None if i is None else str(s.at[i])
+
+
+def _parses(value: str, fmt: str) -> bool:
+    try:
+        return pd.notna(pd.to_datetime(value, format=fmt, utc=False))
+    except (ValueError, TypeError, OverflowError):
+        return False
+
+
+class DateParser:
+    """
+    Finds an export's order-date column and parses it. The column and its
+    strptime format are remembered per export header, so the next upload of
+    the store skips the candidate scan and parses with an explicit format;
+    it only scans again when that format no longer fits. Each profile keeps
+    one (StoreProfile.dates).
+    """
+
+    def __init__(self, date_cols):
+        self.date_cols = tuple(date_cols)
+        self.sources = {}  # header -> (column, format)
+
+    def candidates(self, df: pd.DataFrame):
+        """The profile's date columns, then any column with 'date', 'created' or 'processed' in its name."""
+        keyword = (c for c in df.columns if any(k in str(c).lower() for k in DATE_KEYWORDS))
+        return list(dict.fromkeys([*(c for c in self.date_cols if c in df.columns), *keyword]))
+
+    def source(self, df: pd.DataFrame):
+        """(column, format) remembered for the header of `df`, if it still fits its first date."""
+        cached = self.sources.get(tuple(df.columns))
+        if cached is not None:
+            first = _first_value(df[cached[0]])
+            if first is not None and _parses(first, cached[1]):
+                return cached
+        return None
+
+    def parse(self, df: pd.DataFrame) -> pd.Series:
+        """Parsed datetimes of the first candidate column with any date; an empty Series if none."""
+        cached = self.source(df)
+        if cached is not None:
+            return parse_timestamps(df[cached[0]], cached[1])
+        for col in self.candidates(df):
+            first = _first_value(df[col])
+            if first is None:
+                continue
+            # pandas takes the format from the first value; unguessable ones parse value by value
+            fmt = guess_datetime_format(first) or "mixed"
+            s = parse_timestamps(df[col], fmt)
+            if s.notna().any():
+                self.sources[tuple(df.columns)] = (col, fmt)
+                return s
+        return pd.Series(dtype="datetime64[ns]")
+
+
+def extract_date_series(df: pd.DataFrame, date_cols) -> pd.Series:
+    """Return a parsed datetime series from the first matching date column (nothing remembered)."""
+    return DateParser(date_cols).parse(df)
+
+
+class DateIndex:
+    """
+    The facts' order dates sorted once, so the orders of a date range are two
+    binary searches and a gather: nothing is re-parsed or re-classified when
+    the range changes. Orders without a date fall outside every range.
+    """
+
+    def __init__(self, facts: pd.DataFrame):
+        day = pd.to_datetime(facts["Date"], format="%Y-%m-%d", errors="coerce").to_numpy("datetime64[D]")
+        dated = np.flatnonzero(~np.isnat(day))
+        self.order = dated[np.argsort(day[dated], kind="stable")]
+        self.days = day[self.order]
+
+    def __len__(self):
+        return len(self.days)
+
+    @property
+    def first(self) -> pd.Timestamp:
+        return pd.Timestamp(self.days[0]) if len(self) else pd.NaT
+
+    @property
+    def last(self) -> pd.Timestamp:
+        return pd.Timestamp(self.days[-1]) if len(self) else pd.NaT
+
+    def span(self, start, end) -> tuple[int, int]:
+        """[lo, hi) into the sorted days for the inclusive range start..end."""
+        lo = np.searchsorted(self.days, np.datetime64(pd.Timestamp(start), "D"), side="left")
+        hi = np.searchsorted(self.days, np.datetime64(pd.Timestamp(end), "D"), side="right")
+        return int(lo), int(hi)
+
+    def select(self, facts: pd.DataFrame, start, end):
+        """(facts of the orders dated start..end in their original order, first date, last date)."""
+        lo, hi = self.span(start, end)
+        if lo >= hi:
+            return facts.iloc[:0], pd.NaT, pd.NaT
+        return facts.iloc[np.sort(self.order[lo:hi])], pd.Timestamp(self.days[lo]), pd.Timestamp(self.days[hi - 1])
+
+
+def read_upload(data, profile: StoreProfile) -> pd.DataFrame:
+    """The pruned line-item frame of an upload (see open_upload), as the engine reads it."""
+    cfg = profile.cogs
+    return read_orders_csv(
+        open_upload(data),
+        country_cols=cfg.country_cols,
+        date_cols=profile.date_cols,
+        revenue_cols=cfg.revenue_cols,
+    )
+
+
+def orders_from_lines(df: pd.DataFrame, profile: StoreProfile, timer: "StageTimer | None" = None):
+    """Per-order facts of a parsed upload: (facts, first date, last date)."""
+    timer = timer or StageTimer(profile.key)
+    with timer.stage("extract_date_series", rows=len(df)):
+        ds = profile.dates.parse(df)
+        dmin, dmax = (ds.min(), ds.max()) if not ds.empty else (pd.NaT, pd.NaT)
+    with timer.stage("calc_cogs (blended)", rows=len(df)) as rec:
+        facts = order_facts(df, profile.cogs, ds)
+        rec["orders"] = len(facts)
+    return facts, dmin, dmax
+
+
+def load_orders(data, profile: StoreProfile, timer: "StageTimer | None" = None):
+    """
+    Parse an upload (see open_upload) and build its per-order facts: (facts,
+    first date, last date). Uploads of STREAM_MIN_BYTES or more are read in
+    chunks (see stream_orders), straight from the file when it is one.
+    """
+    timer = timer or StageTimer(profile.key)
+    if upload_size(data) >= STREAM_MIN_BYTES:
+        with timer.stage("stream_orders") as rec:
+            facts, agg = stream_orders(open_upload(data), profile)
+            rec["rows"], rec["orders"] = agg.rows, len(facts)
+        return facts, agg.dmin, agg.dmax
+    with timer.stage("parse") as rec:
+        df = read_upload(data, profile)
+        rec["rows"] = len(df)
+    return orders_from_lines(df, profile, timer)
+
+
+def load_uploads(datas, profile: StoreProfile, timer: "StageTimer | None" = None, read=None):
+    """
+    load_orders over several exports at once: (facts, first date, last date,
+    duplicate lines dropped). The files are parsed in parallel (`read` maps
+    one upload to its lines, read_upload by default) and merged with
+    merge_lines, so overlapping exports don't count an order twice.
+    """
+    timer = timer or StageTimer(profile.key)
+    if len(datas) == 1:
+        return (*load_orders(datas[0], profile, timer), 0)
+    with timer.stage("parse") as rec:
+        frames = map_threads(read or (lambda d: read_upload(d, profile)), datas)
+        rec["rows"] = sum(map(len, frames))
+    with timer.stage("merge_uploads", rows=rec["rows"]) as rec:
+        df, rec["duplicates"] = merge_lines(frames)
+    return (*orders_from_lines(df, profile, timer), rec["duplicates"])
+
+
+# ------------------------- STREAMING -------------------------
+class OrderAggregates:
+    """
+    Running sums over per-order facts, fed one chunk at a time: one row per
+    country, payment gateway and currency however many orders go through,
+    plus the line count and first/last date seen. Without order days, only
+    USD converts without the manual rate.
+    """
+
+    COLUMNS = [
+        "Orders", "Computed", "Main Units", "Main Cost (USD)", "Extras Cost (USD)",
+        "Total COGS (USD)", "Revenue", "NC Orders", "NC COGS (USD)", "NC Revenue",
+    ]
+
+    def __init__(self):
+        keys = pd.MultiIndex.from_arrays([[], [], []], names=["Country", "Gateway", "Currency"])
+        self.totals = pd.DataFrame(columns=self.COLUMNS, index=keys, dtype=float)
+        self.rows = 0
+        self.dmin = self.dmax = pd.NaT
+
+    def add(self, facts: pd.DataFrame, rows: int = 0, dates: pd.Series | None = None):
+        nc = ~facts["Recurring"].astype(bool)
+        part = pd.DataFrame({
+            "Orders": 1,
+            "Computed": facts["Computed?"].astype(int),
+            "Main Units": facts["Main Units"],
+            "Main Cost (USD)": facts["Main Cost (USD)"],
+            "Extras Cost (USD)": facts["Extras Cost (USD)"],
+            "Total COGS (USD)": facts["Total COGS (USD)"],
+            "Revenue": facts["Revenue"],
+            "NC Orders": nc.astype(int),
+            "NC COGS (USD)": facts["Total COGS (USD)"].where(nc, 0.0),
+            "NC Revenue": facts["Revenue"].where(nc, 0.0),
+        }).groupby([facts["Country"], facts["Gateway"], facts["Currency"]]).sum()
+        self.totals = part if self.totals.empty else self.totals.add(part, fill_value=0)
+        self.rows += rows
+        if dates is not None and dates.notna().any():
+            lo, hi = dates.min(), dates.max()
+            self.dmin = lo if pd.isna(self.dmin) else min(self.dmin, lo)
+            self.dmax = hi if pd.isna(self.dmax) else max(self.dmax, hi)
+
+    @property
+    def orders(self) -> int:
+        return int(self.totals["Orders"].sum())
+
+    def cogs_total(self, front_end: bool = False) -> float:
+        return round(float(self.totals["NC COGS (USD)" if front_end else "Total COGS (USD)"].sum()), 2)
+
+    def revenue_and_fees(self, profile: StoreProfile, fx: float = 1.0, front_end: bool = False):
+        """Same figures as revenue_and_fees() over the (front-end) facts."""
+        cols = ["NC Revenue", "NC Orders"] if front_end else ["Revenue", "Orders"]
+        rows = self.totals.groupby(level=["Gateway", "Currency"])[cols].sum()
+        rows.columns = ["Revenue", "Orders"]
+        if not rows["Orders"].sum():
+            return 0.0, 0.0, 0.0, 0.0
+        rows = rows.reset_index()
+        rows["Revenue"] = to_cents(rows["Revenue"])
+        rows["FX Rate"] = usd_rates(pd.Series(pd.NaT, index=rows.index), rows["Currency"], None)
+        return _revenue_and_fees(rows, profile, fx)
+
+
+def stream_orders(src, profile: StoreProfile, *, chunk_rows=None, keep_facts=True):
+    """
+    Chunked equivalent of load_orders for exports too big to hold as line
+    items: (facts or None, OrderAggregates). Every chunk of whole orders is
+    priced on its own and folded into the running aggregates, so memory stays
+    at one chunk plus, with keep_facts, one facts row per order. Orders must
+    be contiguous in the file, as Shopify writes them.
+    """
+    cfg = profile.cogs
+    agg = OrderAggregates()
+    parts = []
+    for chunk in iter_order_chunks(src, country_cols=cfg.country_cols, date_cols=profile.date_cols,
+                                   revenue_cols=cfg.revenue_cols, chunk_rows=chunk_rows):
+        # the first dated chunk pins the column and format for the rest
+        ds = profile.dates.parse(chunk)
+        facts = order_facts(chunk, cfg, ds)
+        agg.add(facts, rows=len(chunk), dates=ds)
+        if keep_facts:
+            parts.append(facts)
+    if not keep_facts:
+        return None, agg
+    if not parts:
+        return pd.DataFrame(columns=FACT_COLUMNS), agg
+    facts = pd.concat(parts, ignore_index=True)
+    split = facts["Order ID"].duplicated()
+    if split.any():
+        raise ValueError(f"Order {facts.loc[split, 'Order ID'].iloc[0]} is not contiguous in the export; "
+                         "it can't be read in chunks.")
+    # same order as the in-memory path, which groups by order Name
+    return facts.sort_values("Order ID", ignore_index=True), agg
+
+
+# ------------------------- CUBE -------------------------
+class OrderCube:
+    """
+    Per-order facts rolled up once into cells of day x country x order type x
+    product category, with additive measures. Each order sits in exactly one
+    cell, so every total (pills, country counts, daily series) is a sum over
+    cells and re-slicing by days or order type never touches the orders.
+
+    Order type is recurring, first (subscription first order) or one-off;
+    product category is "main" (has main units), "extras only" or "other"
+    (only zero-COGS / unmapped lines); the payment gateway prices the fees.
+    Each cell keeps the FX table's USD rate for its day and currency (see
+    usd_rates). Undated orders have a NaT day. Money measures are held in
+    integer cents, so any slice sums to exactly the total of its orders (see
+    money_total).
+    """
+
+    DIMS = ["Day", "Country", "Order Type", "Category", "Gateway", "Currency"]
+    MEASURES = [
+        "Orders", "Computed", "Revenue", "Main Units", "Main Cost (USD)", "Extras Cost (USD)", "Total COGS (USD)",
+    ]
+    MONEY = ["Revenue", "Main Cost (USD)", "Extras Cost (USD)", "Total COGS (USD)"]
+
+    def __init__(self, cells: pd.DataFrame):
+        self.cells = cells
+
+    @classmethod
+    def from_facts(cls, facts: pd.DataFrame, fx_table: pd.DataFrame | None = None) -> "OrderCube":
+        day = pd.to_datetime(facts["Date"], format="%Y-%m-%d", errors="coerce")
+        keys = [
+            day.rename("Day"),
+            facts["Country"],
+            pd.Series(order_types(facts), index=facts.index, name="Order Type"),
+            pd.Series(np.select([facts["Main Units"].to_numpy() > 0, facts["Extras Cost (USD)"].to_numpy() > 0],
+                                ["main", "extras only"], "other"), index=facts.index, name="Category"),
+            facts["Gateway"],
+            facts["Currency"],
+        ]
+        measures = pd.DataFrame({
+            "Orders": 1,
+            "Computed": facts["Computed?"].astype(int),
+            "Revenue": to_cents(facts["Revenue"]),
+            "Main Units": facts["Main Units"],
+            "Main Cost (USD)": to_cents(facts["Main Cost (USD)"]),
+            "Extras Cost (USD)": to_cents(facts["Extras Cost (USD)"]),
+            "Total COGS (USD)": to_cents(facts["Total COGS (USD)"]),
+        }, index=facts.index)
+        if facts.empty:
+            return cls(pd.DataFrame(columns=cls.DIMS + cls.MEASURES + ["FX Rate"]))
+        cells = measures.groupby(keys, dropna=False, sort=True).sum().reset_index()
+        cells["FX Rate"] = usd_rates(cells["Day"], cells["Currency"], fx_table)
+        return cls(cells)
+
+    def __len__(self):
+        return len(self.cells)
+
+    def where(self, start=None, end=None) -> "OrderCube":
+        """The cells of orders dated start..end (inclusive); undated orders drop out."""
+        day = self.cells["Day"]
+        keep = day.notna()
+        if start is not None:
+            keep &= day >= pd.Timestamp(start)
+        if end is not None:
+            keep &= day <= pd.Timestamp(end)
+        return OrderCube(self.cells.loc[keep])
+
+    def frontend(self) -> "OrderCube":
+        """NC (new customer) cells: first and one-off orders (see frontend())."""
+        return OrderCube(self.cells.loc[self.cells["Order Type"] != "recurring"])
+
+    def total(self, measure: str) -> float:
+        total = int(self.cells[measure].sum())
+        return total / 100 if measure in self.MONEY else float(total)
+
+    @property
+    def orders(self) -> int:
+        return int(self.cells["Orders"].sum())
+
+    @property
+    def undated(self) -> int:
+        return int(self.cells.loc[self.cells["Day"].isna(), "Orders"].sum())
+
+    @property
+    def days(self) -> pd.DatetimeIndex:
+        """Every calendar day from the first to the last dated order (empty without dates)."""
+        day = self.cells["Day"].dropna()
+        if day.empty:
+            return pd.DatetimeIndex([])
+        return pd.date_range(day.min(), day.max(), freq="D")
+
+    def cogs_total(self) -> float:
+        return self.total("Total COGS (USD)")
+
+    def revenue_and_fees(self, profile: StoreProfile, fx: float = 1.0):
+        """Same figures as revenue_and_fees() over the cube's orders."""
+        if not self.orders:
+            return 0.0, 0.0, 0.0, 0.0
+        return _revenue_and_fees(self.cells, profile, fx)
+
+    def revenue_by_currency(self, profile: StoreProfile) -> pd.Series:
+        """Revenue as exported per currency (see revenue_by_currency())."""
+        return revenue_by_currency(self.cells, profile)
+
+    def unconverted_orders(self, profile: StoreProfile) -> pd.Series:
+        """Orders in another currency converted at the manual rate for want of an FX rate, per currency."""
+        return unconverted_orders(self.cells, profile)
+
+    def usd_by_day(self, profile: StoreProfile, fx: float = 1.0) -> pd.DataFrame:
+        """Revenue and fees in USD per calendar day (see days), for the daily series."""
+        cells = self.cells.loc[self.cells["Day"].notna()]
+        out = usd_totals(cells, profile, fx, by="Day")[["Revenue (USD)", "Fees (USD)"]]
+        return out.reindex(self.days, fill_value=0.0)
+
+    def country_counts(self) -> pd.DataFrame:
+        """Orders per country, most first (the reconciliation's country table)."""
+        return (
+            self.cells.groupby("Country", dropna=False)["Orders"]
+            .sum()
+            .astype(int)
+            .sort_values(ascending=False)
+            .reset_index()
+        )
+
+    def by_day(self, measures=None) -> pd.DataFrame:
+        """Measures per calendar day (days without orders included), for the daily series."""
+        measures = measures or self.MEASURES
+        cells = self.cells.loc[self.cells["Day"].notna()]
+        out = cells.groupby("Day")[measures].sum().reindex(self.days, fill_value=0)
+        money = [m for m in measures if m in self.MONEY]
+        out[money] = out[money] / 100
+        return out
+
+
+# ------------------------- INSTRUMENTATION -------------------------
+perf_log = logging.getLogger("pnl_engine.perf")
+
+# tracemalloc is process-wide and Streamlit runs every session as a thread of
+# one process: timers share the tracer, started by the first open memory
+# stage and stopped by the last, and its peak is only reset while no other
+# stage is open
+_trace_lock = threading.Lock()
+_trace = {"open": 0, "begins": 0, "owned": False}
+
+
+class StageTimer:
+    """
+    Wall time per pipeline stage, plus the tracemalloc peak when `memory` is
+    on (that roughly quadruples the runtime, so only the Performance panel
+    asks for it). A stage that overlapped another timer's memory stage (another
+    session) gets the process-wide peak since the last reset instead of its own,
+    marked by peak_scope "process". Every finished stage is also logged to
+    `pnl_engine.perf` as one JSON line. Stages must not nest.
+    """
+
+    def __init__(self, store: str, memory: bool = False, records=()):
+        self.store = store
+        self.memory = memory
+        self.records = list(records)
+        self._open = None
+
+    @property
+    def rows(self):
+        """Line count of the upload, from the first stage that recorded one."""
+        return next((r["rows"] for r in self.records if r["rows"] is not None), None)
+
+    def begin(self, stage: str, rows=None, orders=None) -> dict:
+        rec = {"store": self.store, "stage": stage, "rows": rows, "orders": orders}
+        self._begins = None
+        if self.memory:
+            with _trace_lock:
+                if not _trace["open"]:
+                    if not tracemalloc.is_tracing():
+                        tracemalloc.start()
+                        _trace["owned"] = True
+                    tracemalloc.reset_peak()
+                _trace["open"] += 1
+                _trace["begins"] += 1
+                self._begins, self._shared = _trace["begins"], _trace["open"] > 1
+        self._open = (rec, time.perf_counter())
+        return rec
+
+    def end(self) -> dict:
+        rec, t0 = self._open
+        self._open = None
+        secs = time.perf_counter() - t0
+        rec["seconds"] = round(secs, 4)
+        rec["peak_mib"] = rec["peak_scope"] = None
+        if self._begins is not None:
+            with _trace_lock:
+                rec["peak_mib"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+                shared = self._shared or _trace["begins"] != self._begins
+                rec["peak_scope"] = "process" if shared else "stage"
+                _trace["open"] -= 1
+                if not _trace["open"] and _trace["owned"]:
+                    tracemalloc.stop()
+                    _trace["owned"] = False
+        rec["rows_per_sec"] = round(rec["rows"] / secs) if rec["rows"] and secs else None
+        self.records.append(rec)
+        perf_log.info(json.dumps(rec, ensure_ascii=False))
+        return rec
+
+    @contextmanager
+    def stage(self, stage: str, rows=None, orders=None):
+        rec = self.begin(stage, rows, orders)
+        try:
+            yield rec
+        finally:
+            self.end()
@@ -0,0 +1,241 @@
+"""
+Parquet sidecar cache for processed uploads.
+
+The same weekly exports get uploaded again and again to compare periods. Each
+processed upload is kept on disk next to nothing but its content hash: the
+pruned line items (compact dtypes) and the per-order facts built from them.
+A repeat upload loads the facts straight from Parquet and skips CSV parsing
+and classification; after a cost-table change only the facts are rebuilt,
+from the cached lines.
+
+    PNL_CACHE_DIR      cache directory (default ~/.cache/pnl_dashboards)
+    PNL_CACHE_MAX_MB   total size kept before least recently used files go
+                       (default 1024; 0 turns the cache off)
+
+Needs pyarrow; without it every load goes straight to the engine.
+"""
+import importlib.util
+import os
+import tempfile
+
+import pandas as pd
+
+import pnl_engine
+import stores
+
+DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pnl_dashboards")
+DEFAULT_MAX_MB = 1024
+
+
+class SidecarCache:
+    """A directory of Parquet files, trimmed least-recently-used first to `max_bytes`."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.parquet")
+
+    def get(self, key: str):
+        """(frame, meta) stored under `key`, or None."""
+        path = self._path(key)
+        try:
+            df = pd.read_parquet(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            # half-written or from an incompatible version: drop it and rebuild
+            self._remove(path)
+            return None
+        os.utime(path)  # mtime doubles as the last-used time
+        meta, df.attrs = df.attrs, {}
+        return df, meta
+
+    def put(self, key: str, df: pd.DataFrame, **meta):
+        """Store `df` (with `meta` in its attrs), then evict down to the size limit."""
+        df = df.copy(deep=False)
+        df.attrs = meta
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            os.close(fd)
+            try:
+                df.to_parquet(tmp, compression="zstd")
+                os.replace(tmp, self._path(key))
+            finally:
+                self._remove(tmp)
+        except OSError:
+            return  # full or read-only disk: the upload still loads, just uncached
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".parquet"):
+                try:
+                    st = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(os.path.join(self.directory, name))
+            total -= size
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def default_cache() -> SidecarCache | None:
+    """The cache configured by the environment, or None when it is off or pyarrow is missing."""
+    max_mb = float(os.environ.get("PNL_CACHE_MAX_MB", DEFAULT_MAX_MB))
+    if max_mb <= 0 or not importlib.util.find_spec("pyarrow"):
+        return None
+    try:
+        return SidecarCache(os.environ.get("PNL_CACHE_DIR", DEFAULT_DIR), int(max_mb * 2**20))
+    except OSError:
+        return None
+
+
+def _stamp(ts) -> str:
+    return "" if pd.isna(ts) else ts.isoformat()
+
+
+def _unstamp(s: str):
+    return pd.Timestamp(s) if s else pd.NaT
+
+
+def _lookup(cache: SidecarCache, key: str, timer):
+    with timer.stage("parquet cache") as rec:
+        hit = cache.get(key)
+        if hit is not None:
+            rec["rows"], rec["orders"] = hit[1].get("rows"), len(hit[0])
+    return hit
+
+
+def _cached_lines(cache: SidecarCache, key: str, parse) -> pd.DataFrame:
+    hit = cache.get(key)
+    if hit is not None:
+        return hit[0]
+    df = parse()
+    cache.put(key, df)
+    return df
+
+
+def _lines(cache: SidecarCache, key: str, timer, parse) -> pd.DataFrame:
+    """Cached pruned line items, parsing (and storing) them on a miss."""
+    hit = cache.get(key)
+    if hit is not None:
+        return hit[0]
+    with timer.stage("parse") as rec:
+        df = parse()
+        rec["rows"] = len(df)
+    cache.put(key, df)
+    return df
+
+
+def _lines_key(digest: str, profile: pnl_engine.StoreProfile) -> str:
+    # the pruned columns depend on the profile and on the engine's line layout
+    return f"{digest}-{profile.key}-{pnl_engine.LINES_VERSION}-lines"
+
+
+def _merged_digest(digests) -> str:
+    return pnl_engine.content_hash("\n".join(digests).encode("ascii"))
+
+
+def load_lines(data, profile: pnl_engine.StoreProfile, *, digest=None, cache=None) -> pd.DataFrame:
+    """pnl_engine.read_upload through the sidecar cache: the upload's pruned line items."""
+    cache = cache or default_cache()
+    if cache is None:
+        return pnl_engine.read_upload(data, profile)
+    digest = digest or pnl_engine.content_hash(data)
+    return _cached_lines(cache, _lines_key(digest, profile), lambda: pnl_engine.read_upload(data, profile))
+
+
+def load_orders(data, profile: pnl_engine.StoreProfile, *, digest=None, timer=None, cache=None):
+    """pnl_engine.load_orders through the sidecar cache: (facts, first date, last date)."""
+    timer = timer or pnl_engine.StageTimer(profile.key)
+    cache = cache or default_cache()
+    if cache is None:
+        return pnl_engine.load_orders(data, profile, timer)
+    digest = digest or pnl_engine.content_hash(data)
+    # the facts depend on the profile's cost tables and the facts layout too
+    lines_key = _lines_key(digest, profile)
+    facts_key = f"{digest}-{profile.key}-{pnl_engine.table_version(profile)}-{pnl_engine.FACTS_VERSION}-facts"
+
+    hit = _lookup(cache, facts_key, timer)
+    if hit is not None:
+        facts, meta = hit
+        return facts, _unstamp(meta.get("dmin", "")), _unstamp(meta.get("dmax", ""))
+
+    if pnl_engine.upload_size(data) >= pnl_engine.STREAM_MIN_BYTES:
+        # streamed uploads never hold their line items, so only the facts are kept
+        facts, dmin, dmax = pnl_engine.load_orders(data, profile, timer)
+    else:
+        df = _lines(cache, lines_key, timer, lambda: pnl_engine.read_upload(data, profile))
+        facts, dmin, dmax = pnl_engine.orders_from_lines(df, profile, timer)
+    cache.put(facts_key, facts, rows=timer.rows, dmin=_stamp(dmin), dmax=_stamp(dmax))
+    return facts, dmin, dmax
+
+
+def load_uploads(datas, profile: pnl_engine.StoreProfile, *, digests=None, timer=None, cache=None):
+    """
+    pnl_engine.load_uploads through the sidecar cache: (facts, first date,
+    last date, duplicate lines dropped). Each file's lines are cached on their
+    own, the merged facts under the combination of the files.
+    """
+    timer = timer or pnl_engine.StageTimer(profile.key)
+    cache = cache or default_cache()
+    digests = list(digests or map(pnl_engine.content_hash, datas))
+    if len(datas) == 1:
+        return (*load_orders(datas[0], profile, digest=digests[0], timer=timer, cache=cache), 0)
+    if cache is None:
+        return pnl_engine.load_uploads(datas, profile, timer)
+    facts_key = (f"{_merged_digest(digests)}-{profile.key}-{pnl_engine.table_version(profile)}-"
+                 f"{pnl_engine.FACTS_VERSION}-facts")
+
+    hit = _lookup(cache, facts_key, timer)
+    if hit is not None:
+        facts, meta = hit
+        return facts, _unstamp(meta.get("dmin", "")), _unstamp(meta.get("dmax", "")), meta.get("duplicates", 0)
+
+    def read(upload):
+        digest, data = upload
+        return _cached_lines(cache, _lines_key(digest, profile), lambda: pnl_engine.read_upload(data, profile))
+
+    facts, dmin, dmax, dupes = pnl_engine.load_uploads(list(zip(digests, datas)), profile, timer, read=read)
+    cache.put(facts_key, facts, rows=timer.rows, dmin=_stamp(dmin), dmax=_stamp(dmax), duplicates=dupes)
+    return facts, dmin, dmax, dupes
+
+
+def load_gleamont(datas, *, digests=None, timer=None, cache=None):
+    """stores.load_gleamont over one or more uploads, through the sidecar cache: (orders, duplicate lines dropped)."""
+    timer = timer or pnl_engine.StageTimer("gleamont")
+    cache = cache or default_cache()
+    if cache is None:
+        return stores.load_gleamont(datas, timer)
+    digests = list(digests or map(pnl_engine.content_hash, datas))
+    result_key = f"{_merged_digest(digests)}-gleamont-{stores.GLEAMONT_VERSION}-orders"
+
+    hit = _lookup(cache, result_key, timer)
+    if hit is not None:
+        result, meta = hit
+        return result, meta.get("duplicates", 0)
+
+    def read(upload):
+        digest, data = upload
+        return _cached_lines(cache, f"{digest}-gleamont-lines", lambda: stores.read_gleamont_csv(pnl_engine.open_upload(data)))
+
+    if len(datas) == 1 and pnl_engine.upload_size(datas[0]) >= pnl_engine.STREAM_MIN_BYTES:
+        result, dupes = stores.load_gleamont(datas, timer)
+    else:
+        result, dupes = stores.load_gleamont(list(zip(digests, datas)), timer, read=read)
+    cache.put(result_key, result, rows=timer.rows, duplicates=dupes)
+    return result, dupes
@@ -0,0 +1,496 @@
+"""
+Store profiles: everything that differs between the brands' dashboards.
+
+Each dashboard picks its profile from here and hands it to pnl_engine, so a
+cost-table change is one edit and every brand shares the same hot path.
+"""
+import re
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+import pnl_engine
+from pnl_engine import CogsConfig, StoreProfile
+
+ZERO_COGS_KEYS = ["express shipping", "dermatologist guide", "shipping protection"]
+COUNTRY_COLS = ["Shipping Country", "Shipping Country Code", "Shipping Address Country Code", "Shipping Address Country"]
+RECURRING_TAG = "Subscription Recurring Order"  # tag to exclude from front-end / NC view
+GBP_REVENUE_COLS = ["Total", "Total Sales", "Total (GBP)", "Total Price"]
+USD_REVENUE_COLS = ["Total", "Total Sales", "Total (USD)", "Total Price"]
+GBP_DATE_COLS = (
+    "Created at", "Created At", "Processed at", "Order Date", "Order Created At",
+    "下单时间",  # seen in your screenshots
+)
+
+# ------------------------- RHÓMS -------------------------
+RHOMS_MAIN_COST_TABLE = {
+    "United States": {1: 8.00, 2: 10.50, 3: 13.00, 4: 15.50, 5: 18.00, 6: 20.50},
+    "United Kingdom": {1: 5.50, 2: 8.00, 3: 10.00, 4: 12.00, 5: 14.00, 6: 16.00},
+    "Canada": {1: 6.50, 2: 9.00, 3: 11.50, 4: 14.50, 5: 17.00, 6: 21.00},
+
+    # NEW:
+    "Netherlands": {1: 6.00, 2: 9.00, 3: 11.50, 4: 14.00, 5: 16.50, 6: 20.00},
+    "Australia":   {1: 7.00, 2: 9.50, 3: 12.00, 4: 14.50, 5: 17.00, 6: 19.50},
+    "New Zealand": {1: 7.50, 2: 10.00, 3: 12.50, 4: 15.50, 5: 18.50, 6: 21.00},
+}
+
+RHOMS_EXTRA_COSTS = {
+    "irritation proof razor": {
+        "United States": 5.50,
+        "United Kingdom": 4.50,
+        "Canada": 5.50,
+        "Netherlands": 5.00,     # NEW
+        "Australia": 5.00,       # NEW
+        "New Zealand": 5.50,     # NEW
+    },
+    "razor close trimmer": {
+        "United Kingdom": 10.50,
+        "Netherlands": 11.00,    # NEW
+        "Australia": 11.00,      # NEW
+        "New Zealand": 11.50,    # NEW
+    },
+    "shaving foam": {
+        "United States": 6.00,
+        "United Kingdom": 5.00,
+        "Canada": 6.00,
+        "Netherlands": 5.50,     # NEW
+        "Australia": 5.50,       # NEW
+        "New Zealand": 6.00,     # NEW
+    },
+}
+
+RHOMS_COUNTRY_MAP = {
+    "GB":"United Kingdom","UK":"United Kingdom","United Kingdom":"United Kingdom",
+    "CA":"Canada","CAN":"Canada","Canada":"Canada",
+    "US":"United States","USA":"United States","United States":"United States",
+    # NEW:
+    "NL":"Netherlands","NLD":"Netherlands","Netherlands":"Netherlands",
+    "AU":"Australia","AUS":"Australia","Australia":"Australia",
+    "NZ":"New Zealand","NZL":"New Zealand","New Zealand":"New Zealand",
+}
+
+RHOMS = StoreProfile(
+    key="rhoms",
+    name="Rhóms",
+    cogs=CogsConfig(
+        main_cost_table=RHOMS_MAIN_COST_TABLE,
+        extra_costs=RHOMS_EXTRA_COSTS,
+        main_aliases=[
+            "smoothing solution",
+            "smoothing serum",
+            "advanced triple acid roller for razor bumps",  # new alias (normalized)
+        ],
+        zero_cogs_keys=ZERO_COGS_KEYS,
+        country_map=RHOMS_COUNTRY_MAP,
+        country_cols=COUNTRY_COLS,
+        revenue_cols=GBP_REVENUE_COLS,
+        recurring_tag=RECURRING_TAG,
+    ),
+    currency="GBP",
+    fx_default=1.30,
+    date_cols=GBP_DATE_COLS,
+)
+
+# Same tables as Rhóms; the DC store sells the Yevivo bottle as its main product.
+RHOMS_DC = StoreProfile(
+    key="rhoms_dc",
+    name="Rhóms DC",
+    cogs=CogsConfig(
+        main_cost_table=RHOMS_MAIN_COST_TABLE,
+        extra_costs=RHOMS_EXTRA_COSTS,
+        main_aliases=[
+            "yevivo premium liquid collagen",  # main Yevivo bottle
+        ],
+        zero_cogs_keys=ZERO_COGS_KEYS,
+        country_map=RHOMS_COUNTRY_MAP,
+        country_cols=COUNTRY_COLS,
+        revenue_cols=GBP_REVENUE_COLS,
+        recurring_tag=RECURRING_TAG,
+    ),
+    currency="GBP",
+    fx_default=1.30,
+    date_cols=GBP_DATE_COLS,
+)
+
+# ------------------------- GLEAMONT (v2, tiered) -------------------------
+GLEAMONT_V2 = StoreProfile(
+    key="gleamont_v2",
+    name="Gleamont v2",
+    cogs=CogsConfig(
+        main_cost_table={
+            "United Kingdom": {1: 5.3, 2: 6.8, 3: 8.3, 4: 9.8, 5: 11.2, 6: 12.6},
+            "United States":  {1: 6.3, 2: 7.8, 3: 9.2, 4: 10.7, 5: 12.1, 6: 13.5},
+            "Canada":         {1: 6.5, 2: 8.1, 3: 9.7, 4: 11.2, 5: 12.8, 6: 14.4},
+            "Australia":      {1: 6.9, 2: 8.5, 3: 10.2, 4: 11.8, 5: 13.4, 6: 14.9},
+            "New Zealand":    {1: 6.1, 2: 7.7, 3: 9.4, 4: 10.9, 5: 12.5, 6: 14.0},
+            "Netherlands":    {1: 7.8, 2: 9.3, 3: 10.9, 4: 12.5, 5: 14.0, 6: 15.6},
+        },
+        extra_costs={},
+        main_aliases=[
+            "gleamont clinical strength internal deodrant",
+            "gleamont clinical strength internal deodorant",
+        ],
+        zero_cogs_keys=ZERO_COGS_KEYS,
+        country_map=RHOMS_COUNTRY_MAP,
+        country_cols=COUNTRY_COLS,
+        revenue_cols=GBP_REVENUE_COLS,
+        recurring_tag=RECURRING_TAG,
+    ),
+    currency="GBP",
+    fx_default=1.30,
+    date_cols=GBP_DATE_COLS,
+)
+
+# ------------------------- YEVIVO -------------------------
+# YEVIVO MAIN PRODUCT COGS (USD) – from your screenshots:
+# Australia: 1pc=8, 2pc=10.3, 3pc=12.9, 4pc=15.3
+# UK:        1pc=6.2, 2pc=8.8, 3pc=11.3, 4pc=13.8
+# 5+ units are extrapolated using the step between tiers 3 and 4.
+YEVIVO = StoreProfile(
+    key="yevivo",
+    name="Yevivo",
+    cogs=CogsConfig(
+        main_cost_table={
+            "Australia": {
+                1: 8.0,
+                2: 10.3,
+                3: 12.9,
+                4: 15.3,
+            },
+            "United Kingdom": {
+                1: 6.2,
+                2: 8.8,
+                3: 11.3,
+                4: 13.8,
+            },
+        },
+        # No extras yet for Yevivo – leave empty for now.
+        extra_costs={
+            # "some extra product name": {"Australia": X, "United Kingdom": Y}
+        },
+        # Treat any Yevivo bottle line as the main product. This is intentionally
+        # loose so it works for single bottles, 2/3/4 packs and any bundle where the
+        # name still contains 'Yevivo'.
+        main_aliases=["yevivo"],
+        zero_cogs_keys=ZERO_COGS_KEYS,
+        country_map={
+            "GB": "United Kingdom",
+            "UK": "United Kingdom",
+            "United Kingdom": "United Kingdom",
+            "AU": "Australia",
+            "AUS": "Australia",
+            "Australia": "Australia",
+        },
+        country_cols=COUNTRY_COLS,
+        first_valid_country=True,
+        revenue_cols=USD_REVENUE_COLS,
+        recurring_tag=RECURRING_TAG,
+    ),
+)
+
+# ------------------------- YEVIVO CANADA -------------------------
+# MAIN PRODUCT COGS (USD) – Canada only
+# Supplier table:
+#  1 pc  ->  7.60
+#  3 pcs -> 13.80
+#  5 pcs -> 20.00
+#
+# We'll fill 2 & 4 pcs linearly so extrapolation works cleanly:
+#  2 pcs -> 10.70
+#  4 pcs -> 16.90
+YEVIVO_CA = StoreProfile(
+    key="yevivo_ca",
+    name="Yevivo Canada",
+    cogs=CogsConfig(
+        main_cost_table={
+            "Canada": {
+                1: 8.5,     # UPDATED (old: 7.6 → 7.9 → 8.5)
+                2: 12.5,    # UPDATED (old: 10.7 → 11.15 → 12.5)
+                3: 15.5,    # UPDATED (old: 13.8 → 14.4 → 15.5)
+                4: 19.0,    # UPDATED (old: 16.9 → 18.2 → 19.0)
+                5: 22.5,    # UPDATED (old: 20.0 → 22.0 → 22.5 ❌ → 25.5 ✅ supplier-confirmed)
+            },
+            "Australia": {
+                1: 8.0,     # NEW (no previous price)
+                2: 10.5,    # NEW (no previous price)
+                3: 13.5,    # NEW (no previous price)
+                4: 15.5,    # NEW (no previous price)
+                5: 18.0,    # NEW (no previous price)
+            },
+            "United Kingdom": {
+                1: 7.5,     # UPDATED (old: 5.7 → 6.5 → 7.5)
+                2: 10.0,    # UPDATED (old: 8.25 → 9.45 → 10.0)
+                3: 13.0,    # UPDATED (old: 10.8 → 12.4 → 13.0)
+                4: 16.0,    # UPDATED (old: 13.1 → 15.15 → 16.0)
+                5: 19.0,    # UPDATED (old: 15.4 → 17.9 → 19.0)
+            },
+            "United States": {
+                1: 10.0,    # UPDATED (old: 7.5 → 10.0)
+                2: 14.5,    # UPDATED (old: 10.55 → 14.5)
+                3: 19.5,    # UPDATED (old: 13.6 → 19.5)
+                4: 24.5,    # UPDATED (old: 16.9 → 24.5)
+                5: 28.0,    # UPDATED (old: 20.2 → 28.0)
+            },
+        },
+        # No extras yet – leave empty for now.
+        extra_costs={
+            # "some extra product name": {"Canada": X}
+        },
+        # Treat any Yevivo bottle line as the main product. This is intentionally
+        # loose so it works for single bottles and 2/3/5 packs (with FREE GIFT lines).
+        main_aliases=["yevivo"],
+        zero_cogs_keys=ZERO_COGS_KEYS,
+        country_map={
+            # Canada
+            "CA": "Canada",
+            "CAN": "Canada",
+            "Canada": "Canada",
+
+            # United States
+            "US": "United States",
+            "USA": "United States",
+            "United States": "United States",
+            "United States of America": "United States",
+
+            # United Kingdom
+            "GB": "United Kingdom",
+            "GBR": "United Kingdom",
+            "UK": "United Kingdom",
+            "United Kingdom": "United Kingdom",
+            "Great Britain": "United Kingdom",
+        },
+        country_cols=COUNTRY_COLS,
+        first_valid_country=True,
+        revenue_cols=USD_REVENUE_COLS,
+        recurring_tag=RECURRING_TAG,
+    ),
+)
+
+PROFILES = {p.key: p for p in (RHOMS, RHOMS_DC, GLEAMONT_V2, YEVIVO, YEVIVO_CA)}
+
+
+# ------------------------- GLEAMONT (fitted 1/3/5 model) -------------------------
+# The original Gleamont dashboard prices S + U*n from a fit through its 1/3/5
+# tiers rather than from a tier table, so it keeps its own per-order pipeline.
+GLEAMONT_COGS = {
+    "United Kingdom": {1: 6.7, 3: 9.9, 5: 12.9},
+    "United States":  {1: 6.2, 3: 9.2, 5: 11.8},
+    "Canada":         {1: 6.8, 3:10.6, 5: 14.1},
+    "Australia":      {1: 6.7, 3:10.1, 5: 13.3},
+    "New Zealand":    {1: 7.7, 3:11.2, 5: 14.5},
+}
+
+# Map shipping country code to our region name
+GLEAMONT_COUNTRY_CODE_TO_REGION = {
+    "GB": "United Kingdom",
+    "UK": "United Kingdom",
+    "US": "United States",
+    "CA": "Canada",
+    "AU": "Australia",
+    "NZ": "New Zealand",
+    # NL/EU handled specially below
+}
+
+GLEAMONT_EU_CODES = {"NL", "EU"}
+
+# Columns that often carry country
+GLEAMONT_COUNTRY_COLS = ["Shipping Country", "Billing Country"]
+
+# Items that we explicitly skip from costing
+GLEAMONT_ZERO_COGS_PHRASES = [
+    "shipping protection",
+    "route package protection",
+    "gift card",
+]
+
+GLEAMONT_BASE_PRODUCT_TOKEN = "gleamont clinical strength internal deodorant"  # normalized token
+
+GLEAMONT_VERSION = pnl_engine.table_version(
+    GLEAMONT_COGS, GLEAMONT_COUNTRY_CODE_TO_REGION, GLEAMONT_EU_CODES, GLEAMONT_COUNTRY_COLS,
+    GLEAMONT_ZERO_COGS_PHRASES, GLEAMONT_BASE_PRODUCT_TOKEN,
+)
+
+def normalize_name(s: str) -> str:
+    s = s or ""
+    s = s.lower()
+    # strip [free gift] or similar prefixes
+    s = re.sub(r"\[.*?\]", "", s)
+    # replace fancy dashes/emdash
+    s = s.replace("—", " ").replace("-", " ")
+    # normalize misspelling 'deodrant' -> 'deodorant'
+    s = s.replace("deodrant", "deodorant")
+    s = re.sub(r"\s+", " ", s)
+    return s.strip()
+
+def is_base_product(line_name: str) -> bool:
+    n = normalize_name(line_name)
+    return GLEAMONT_BASE_PRODUCT_TOKEN in n
+
+def is_zero_cogs(line_name: str) -> bool:
+    n = normalize_name(line_name)
+    return any(phrase in n for phrase in GLEAMONT_ZERO_COGS_PHRASES)
+
+@dataclass
+class CountryModel:
+    S: float  # shipment overhead per order
+    U: float  # per-unit cost
+
+_country_model_cache = {}
+
+def fit_country_model(region: str) -> CountryModel:
+    # Fit S + U*n using exact points at n=1,3,5
+    if region in _country_model_cache:
+        return _country_model_cache[region]
+    pts = GLEAMONT_COGS[region]
+    xs = np.array([1.0, 3.0, 5.0])
+    ys = np.array([pts[1], pts[3], pts[5]], dtype=float)
+    A = np.vstack([np.ones_like(xs), xs]).T
+    # least squares
+    S, U = np.linalg.lstsq(A, ys, rcond=None)[0]
+    model = CountryModel(S=float(S), U=float(U))
+    _country_model_cache[region] = model
+    return model
+
+def compute_costs(regions: pd.Series, units: pd.Series) -> np.ndarray:
+    # S + U*n per order, with S and U gathered from the fitted model of each
+    # order's region; orders without units or a priced region cost nothing.
+    S = regions.map({r: fit_country_model(r).S for r in GLEAMONT_COGS}).to_numpy(dtype=float, na_value=np.nan)
+    U = regions.map({r: fit_country_model(r).U for r in GLEAMONT_COGS}).to_numpy(dtype=float, na_value=np.nan)
+    n = units.to_numpy()
+    return np.where((n > 0) & ~np.isnan(S), S + U * n, 0.0)
+
+def detect_regions(first_rows: pd.DataFrame) -> pd.DataFrame:
+    # Return region + eu_adjust per order from its first row: the first
+    # non-blank country column wins, as the per-row lookup used to do.
+    code = pd.Series(np.nan, index=first_rows.index, dtype=object)
+    for col in reversed(GLEAMONT_COUNTRY_COLS):
+        if col in first_rows:
+            c = pnl_engine.map_unique(first_rows[col], lambda v: str(v).strip().upper() if pd.notna(v) else "")
+            code = c.where(c != "", code)
+    eu_adjust = code.isin(GLEAMONT_EU_CODES)
+    region = code.map(GLEAMONT_COUNTRY_CODE_TO_REGION).astype(object)
+    region[eu_adjust] = "United Kingdom"  # Use UK base + $1
+    region = region.where(region.notna(), None)
+    return pd.DataFrame({"region": region, "eu_adjust": eu_adjust})
+
+GLEAMONT_ORDER_COLS = ["Region", "Units (incl. gifts)", "Revenue", "COGS", "Warning", "Tags", "Is Recurring", "Is First Order"]
+
+def read_gleamont_csv(src) -> pd.DataFrame:
+    return pnl_engine.read_orders_csv(src, country_cols=GLEAMONT_COUNTRY_COLS, revenue_cols=["Total"])
+
+def gleamont_orders(df: pd.DataFrame) -> pd.DataFrame:
+    """Per-order Region / units / Revenue / COGS / warnings / subscription flags, indexed by order."""
+    # Build per-order aggregates
+    # Determine units of base product per order (including FREE GIFT variant) and revenue
+    # classified once per distinct product name, then broadcast to the rows
+    is_base = pnl_engine.map_unique(df["Lineitem name"], lambda n: is_base_product(str(n))).astype(bool)
+
+    # Revenue per order (take 'Total' once per order)
+    order_rev = df.groupby("Name")["Total"].first()
+
+    # Units for base product (sum ALL base and gift variants)
+    units = df[is_base].groupby("Name")["Lineitem quantity"].sum().rename("units")
+    units = units.reindex(order_rev.index).fillna(0).astype(int)
+
+    # Country/Region per order, read off each order's first row
+    first_rows = df.drop_duplicates("Name").set_index("Name")
+    region_df = detect_regions(first_rows).reindex(order_rev.index)
+
+    # Tags per order
+    tags = df.groupby("Name")["Tags"].first().astype(object).fillna("")
+    is_recurring = tags.str.contains("Subscription Recurring Order", case=False, na=False)
+    is_first = tags.str.contains("Subscription First Order", case=False, na=False)
+
+    # Compute COGS per order
+    u = units.to_numpy()
+    unmapped = (u > 0) & region_df["region"].isna().to_numpy()
+    eu_adj = (u > 0) & region_df["eu_adjust"].to_numpy(dtype=bool)
+    costs = compute_costs(region_df["region"], units) + np.where(eu_adj, 1.0, 0.0)
+    warnings = np.select([unmapped, eu_adj], ["Unmapped country", "EU/NL +$1 applied"], "")
+
+    result = pd.DataFrame({
+        "Order": order_rev.index,
+        "Region": region_df["region"].values,
+        "Units (incl. gifts)": units.values,
+        "Revenue": order_rev.values,
+        "COGS": costs,
+        "Warning": warnings,
+        "Tags": tags.reindex(order_rev.index).values,
+        "Is Recurring": is_recurring.reindex(order_rev.index).values,
+        "Is First Order": is_first.reindex(order_rev.index).values,
+    }).set_index("Order")
+
+    return result
+
+def stream_gleamont(src, chunk_rows=None) -> pd.DataFrame:
+    """gleamont_orders over an export read in chunks of whole orders (see pnl_engine.stream_orders)."""
+    parts = [gleamont_orders(chunk) for chunk in pnl_engine.iter_order_chunks(
+        src, country_cols=GLEAMONT_COUNTRY_COLS, revenue_cols=["Total"], chunk_rows=chunk_rows)]
+    if not parts:
+        return pd.DataFrame(columns=GLEAMONT_ORDER_COLS).rename_axis("Order")
+    result = pd.concat(parts)
+    if result.index.duplicated().any():
+        raise ValueError(f"Order {result.index[result.index.duplicated()][0]} is not contiguous in the export; "
+                         "it can't be read in chunks.")
+    return result.sort_index()
+
+def load_gleamont(datas, timer: "pnl_engine.StageTimer | None" = None, read=None):
+    """
+    Parse one or more Gleamont uploads and price their orders: (orders,
+    duplicate lines dropped). Like pnl_engine.load_uploads, several files are
+    parsed in parallel (`read` maps one item of `datas` to its lines) and
+    merged without double-counting; one big upload is streamed instead.
+    """
+    timer = timer or pnl_engine.StageTimer("gleamont")
+    if read is None and len(datas) == 1 and pnl_engine.upload_size(datas[0]) >= pnl_engine.STREAM_MIN_BYTES:
+        with timer.stage("stream_orders") as rec:
+            result = stream_gleamont(pnl_engine.open_upload(datas[0]))
+            rec["orders"] = len(result)
+        return result, 0
+    with timer.stage("parse") as rec:
+        frames = pnl_engine.map_threads(read or (lambda d: read_gleamont_csv(pnl_engine.open_upload(d))), datas)
+        rec["rows"] = sum(map(len, frames))
+    df, dupes = frames[0], 0
+    if len(frames) > 1:
+        with timer.stage("merge_uploads", rows=rec["rows"]) as rec:
+            df, dupes = pnl_engine.merge_lines(frames)
+            rec["duplicates"] = dupes
+    with timer.stage("calc_cogs (blended)", rows=len(df)) as rec:
+        result = gleamont_orders(df)
+        rec["orders"] = len(result)
+    return result, dupes
+
+def gleamont_fees(revenue: pd.Series, fee_pct: float, fixed_fee: float) -> pd.Series:
+    """Payment processor fees per order: `fee_pct` percent of revenue plus a fixed fee."""
+    return (fee_pct/100.0) * revenue + fixed_fee
+
+def gleamont_pnl(result: pd.DataFrame, ad_spend: float) -> dict:
+    """The Gleamont dashboard's copy row for priced orders (with their "Proc Fees"), store currency."""
+    nc_mask = result["Is First Order"]
+    rev_total = float(result["Revenue"].sum())
+    cogs_total = float(result["COGS"].sum())
+    fees_total = float(result["Proc Fees"].sum())
+    rev_nc = float(result.loc[nc_mask, "Revenue"].sum())
+    cogs_nc = float(result.loc[nc_mask, "COGS"].sum())
+    fees_nc = float(result.loc[nc_mask, "Proc Fees"].sum())
+
+    blended_profit = rev_total - cogs_total - fees_total - ad_spend
+    blended_roas = rev_total / ad_spend if ad_spend else np.nan
+    nc_profit = rev_nc - cogs_nc - fees_nc - ad_spend
+    nc_roas = rev_nc / ad_spend if ad_spend else np.nan
+    return {
+        "Revenue_Total": round(rev_total, 2),
+        "Ad_Spend": round(ad_spend, 2),
+        "COGS_Total": round(cogs_total, 2),
+        "Fees_Total": round(fees_total, 2),
+        "Blended_Profit": round(blended_profit, 2),
+        "Blended_ROAS": round(blended_roas, 3) if not np.isnan(blended_roas) else "",
+        "NC_Revenue": round(rev_nc, 2),
+        "NC_COGS": round(cogs_nc, 2),
+        "NC_Fees": round(fees_nc, 2),
+        "NC_Profit": round(nc_profit, 2),
+        "NC_ROAS": round(nc_roas, 3) if not np.isnan(nc_roas) else "",
+        "Orders": int(len(result)),
+        "NC_Orders": int(nc_mask.sum()),
+    }
@@ -0,0 +1,120 @@
+"""
+Synthetic Shopify order exports for benchmarking and equivalence checks.
+
+Orders look like a real Shopify export: several line items per order, with the
+order-level columns (Total, Tags, Created at, country...) only on the first
+line. Product names come from the store profile's aliases, extras and
+zero-COGS keys, plus some lines no table knows about.
+"""
+import numpy as np
+import pandas as pd
+
+import stores
+
+LINES_PER_ORDER = [1, 1, 1, 2, 2, 3, 4]                       # ~2 lines per order
+QUANTITIES = [0, 1, 1, 1, 1, 2, 2, 3, 4, 6, 7, 9]
+UNMAPPED_NAMES = ["Mystery Box", "Gift Card £10", "Travel Pouch"]
+UNKNOWN_COUNTRIES = ["DE", "FR", "XX", ""]
+PAYMENT_METHODS = np.array(["Shopify Payments", "PayPal Express Checkout", "Klarna"], dtype=object)
+
+
+def _name_pool(aliases, extra_keys, zero_keys):
+    """(names, weights): main lines dominate, like a real store."""
+    main = []
+    for a in aliases:
+        t = a.title()
+        main += [t, f"{t} – 3 Pack", f"[FREE GIFT] {t}"]
+    groups = [
+        (main, 0.6),
+        ([k.title() for k in extra_keys], 0.15),
+        ([k.title() for k in zero_keys], 0.15),
+        (UNMAPPED_NAMES, 0.1),
+    ]
+    groups = [(g, w) for g, w in groups if g]
+    total = sum(w for _, w in groups)
+    names, weights = [], []
+    for g, w in groups:
+        names += g
+        weights += [w / total / len(g)] * len(g)
+    return np.array(names, dtype=object), np.array(weights)
+
+
+def generate_orders(n_rows: int, *, aliases, extra_keys, zero_keys, country_codes, country_cols,
+                    currency="GBP", seed=0) -> pd.DataFrame:
+    """Return a Shopify-style export with about `n_rows` line-item rows."""
+    rng = np.random.default_rng(seed)
+    n_orders = max(1, int(n_rows / np.mean(LINES_PER_ORDER)))
+    n_lines = rng.choice(LINES_PER_ORDER, n_orders)
+    order_idx = np.repeat(np.arange(n_orders), n_lines)
+    first = np.r_[True, order_idx[1:] != order_idx[:-1]]
+    n = len(order_idx)
+
+    names, weights = _name_pool(aliases, extra_keys, zero_keys)
+    countries = np.array(list(country_codes) + UNKNOWN_COUNTRIES, dtype=object)
+    c_weights = np.r_[np.full(len(country_codes), 0.95 / max(len(country_codes), 1)),
+                      np.full(len(UNKNOWN_COUNTRIES), 0.05 / len(UNKNOWN_COUNTRIES))]
+    order_country = rng.choice(countries, n_orders, p=c_weights / c_weights.sum())
+    tags = rng.choice(np.array(["", "Subscription First Order", "Subscription Recurring Order"], dtype=object),
+                      n_orders, p=[0.5, 0.2, 0.3])
+    created = pd.Timestamp("2025-01-01") + pd.to_timedelta(
+        np.sort(rng.integers(0, 90 * 86400, n_orders)), unit="s")
+    created = created.strftime("%Y-%m-%d %H:%M:%S +0000").to_numpy(dtype=object)
+    price = np.round(rng.uniform(5, 60, n), 2)
+    qty = rng.choice(QUANTITIES, n)
+    line_total = price * qty
+    total = np.round(np.bincount(order_idx, weights=line_total, minlength=n_orders) * 1.05, 2)
+
+    def order_level(values):
+        # order-level fields only appear on the first line of each order
+        out = np.full(n, None, dtype=object)
+        out[first] = values
+        return out
+
+    df = pd.DataFrame({
+        "Name": np.char.add("#", (1001 + order_idx).astype(str)).astype(object),
+        "Created at": order_level(created),
+        "Currency": order_level(np.full(n_orders, currency, dtype=object)),
+        "Total": pd.array(order_level(total), dtype="Float64"),
+        "Tags": order_level(tags),
+        "Lineitem quantity": qty,
+        "Lineitem name": rng.choice(names, n, p=weights),
+        "Lineitem price": price,
+    })
+    for i, col in enumerate(country_cols[:2]):
+        # Shopify repeats nothing on follow-up lines; the second country column
+        # (billing / country code) is blank on a few orders so fallbacks get exercised.
+        vals = order_country if i == 0 else np.where(rng.random(n_orders) < 0.1, "", order_country)
+        df[col] = order_level(vals)
+    df["Payment Method"] = order_level(rng.choice(PAYMENT_METHODS, n_orders, p=[0.75, 0.2, 0.05]))
+    return df
+
+
+def profile_export(profile, n_rows: int, seed=0) -> pd.DataFrame:
+    cfg = profile.cogs
+    return generate_orders(
+        n_rows,
+        aliases=cfg.main_aliases,
+        extra_keys=list(cfg.extra_costs),
+        zero_keys=cfg.zero_cogs_keys,
+        country_codes=list(cfg.country_map),
+        country_cols=cfg.country_cols,
+        currency=profile.currency,
+        seed=seed,
+    )
+
+
+def gleamont_export(n_rows: int, seed=0) -> pd.DataFrame:
+    return generate_orders(
+        n_rows,
+        aliases=[stores.GLEAMONT_BASE_PRODUCT_TOKEN, "gleamont clinical strength internal deodrant"],
+        extra_keys=[],
+        zero_keys=stores.GLEAMONT_ZERO_COGS_PHRASES,
+        country_codes=[*stores.GLEAMONT_COUNTRY_CODE_TO_REGION, *stores.GLEAMONT_EU_CODES],
+        country_cols=stores.GLEAMONT_COUNTRY_COLS,
+        currency="GBP",
+        seed=seed,
+    )
+
+
+def to_csv_bytes(df: pd.DataFrame) -> bytes:
+    return df.to_csv(index=False).encode("utf-8")
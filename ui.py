@@ -0,0 +1,426 @@
+"""
+Streamlit pieces shared by the profitability dashboards: the dark/lime theme,
+KPI pills, the cached upload loader and the quick-paste / reconciliation
+sections every brand renders the same way.
+"""
+import json as _json
+import logging
+from io import StringIO as _StringIO
+
+import pandas as pd
+import streamlit as st
+from streamlit.components.v1 import html as _st_html
+
+import fx_rates
+import pnl_engine
+import sidecar
+import warehouse
+
+# stage timings go to the app's stderr as JSON lines (see pnl_engine.StageTimer)
+if not pnl_engine.perf_log.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+    pnl_engine.perf_log.addHandler(_handler)
+    pnl_engine.perf_log.setLevel(logging.INFO)
+    pnl_engine.perf_log.propagate = False
+
+# ------------------------- GLOBAL STYLES -------------------------
+# Dark mode + lime accent + condensed headline stack (Futura-Condensed first, with solid fallbacks)
+STYLES = """
+<style>
+:root{
+  --bg:#0b0f15;
+  --panel:#121826;
+  --panel-2:#0f1520;
+  --text:#e5e7eb;
+  --muted:#9aa4b2;
+  --border:#1f2937;
+  --lime:#A4DB32;
+  --lime-weak:#c9f27a33;
+  --red:#ef4444;
+}
+
+/* Base layout / typography */
+html, body, .block-container{background:var(--bg); color:var(--text);}
+.block-container{padding-top:1.6rem; padding-bottom:2rem; max-width:1100px;}
+h1{font-size:2.4rem!important; letter-spacing:.3px; margin:.1rem 0 .8rem}
+.caption{color:var(--muted)}
+
+/* Grid rows for KPI pills */
+.row-4{display:grid;grid-template-columns:repeat(4,1fr);gap:14px;margin:14px 0 10px}
+.row-3{display:grid;grid-template-columns:repeat(3,1fr);gap:14px;margin:14px 0 10px}
+.row-2{display:grid;grid-template-columns:repeat(2,1fr);gap:14px;margin:14px 0 10px}
+
+/* KPI pills */
+.pill{
+  border-radius:14px; background:var(--panel); border:1px solid var(--border);
+  padding:16px 18px; box-shadow:0 8px 24px rgba(0,0,0,.25), inset 0 1px 0 rgba(255,255,255,.02);
+}
+.pill .label{font-size:.82rem; color:var(--muted); letter-spacing:.2px; margin-bottom:.25rem; font-weight:600;}
+.pill .value{font-weight:900; font-size:2.2rem; line-height:1.05; color:var(--text);}
+.pill .sub{color:#aab4c2; font-size:.86rem; margin-top:.35rem}
+.pill.positive{ border:1px solid var(--lime); box-shadow:0 0 0 1px var(--lime-weak), 0 8px 24px rgba(0,0,0,.25); }
+.pill.positive .value{ color:var(--lime); }
+.pill.negative{ border:1px solid var(--red); background:linear-gradient(180deg, #1b1111, var(--panel)); }
+.pill.negative .value{ color:#ff7a7a; }
+
+/* FX chip */
+.fxchip{
+  display:inline-flex; gap:8px; align-items:center; font-size:.82rem; color:var(--text);
+  background:linear-gradient(180deg, #151c28, #0e1420);
+  border:1px solid var(--border); padding:6px 10px; border-radius:999px;
+}
+.fxchip .dot{width:8px; height:8px; background:var(--lime); border-radius:999px; box-shadow:0 0 10px var(--lime);}
+.hr{height:1px; background:var(--border); margin:12px 0 6px; opacity:.6}
+
+/* ===== HERO INPUTS (lime, huge, glowing) ===== */
+.hero-pil{
+  border-radius:18px; background:var(--panel); border:1px solid var(--border);
+  box-shadow:0 10px 28px rgba(0,0,0,.35), 0 0 0 1px rgba(255,255,255,.03), 0 0 20px rgba(164,219,50,.10);
+  padding:18px; transition:box-shadow .2s, border-color .2s;
+}
+.hero-pil:hover{
+  border-color: var(--lime);
+  box-shadow:0 12px 32px rgba(0,0,0,.45), 0 0 0 1px rgba(164,219,50,.25), 0 0 28px rgba(164,219,50,.20);
+}
+.hero-label{font-size:1rem; font-weight:800; color:var(--muted); margin:0 0 6px 2px;}
+.hero-pil .big{ font-size:1.1rem; }
+
+/* File uploader (lime accent, scoped to the dropzone) */
+.hero-pil [data-testid="stFileUploader"] [data-testid="stFileUploaderDropzone"]{
+  background:linear-gradient(180deg,#151c28,#0e1420);
+  border:1px dashed var(--lime); border-radius:14px;
+  padding:18px; box-shadow: inset 0 0 0 1px rgba(164,219,50,.12), 0 0 16px rgba(164,219,50,.10);
+}
+.hero-pil [data-testid="stFileUploader"] button{
+  border:1px solid var(--lime); color:var(--text); background:transparent;
+}
+.hero-pil [data-testid="stFileUploader"] button:hover{ background: rgba(164,219,50,.08); }
+
+/* Number input (lime border + glow), scoped by testid */
+.hero-pil [data-testid="stNumberInput"] > div > div{
+  background:linear-gradient(180deg,#151c28,#0e1420);
+  border:1px solid var(--lime); border-radius:14px;
+  box-shadow: inset 0 0 0 1px rgba(164,219,50,.12), 0 0 16px rgba(164,219,50,.10);
+}
+.hero-pil [data-testid="stNumberInput"] input{
+  color:var(--text); font-size:1.6rem; font-weight:900; padding:16px 14px;
+}
+.hero-pil [data-testid="stNumberInput"] svg{ color:var(--text); }  /* + / – icons */
+/* Align labels consistently */
+.hero-pil .stFileUploader, .hero-pil .stNumberInput{ margin-top:6px; }
+
+/* Compact Streamlit internal labels (optional) */
+.st-emotion-cache-1c7y2kd, .st-emotion-cache-1p2eins{ font-size:.9rem; }
+
+/* chip row */
+.chips{display:flex; gap:10px; align-items:center; flex-wrap:wrap}
+
+/* date chip (matches fxchip but with a calendar accent) */
+.datechip{
+  display:inline-flex; gap:8px; align-items:center; font-size:.82rem; color:var(--text);
+  background:linear-gradient(180deg, #151c28, #0e1420);
+  border:1px solid var(--border); padding:6px 10px; border-radius:999px;
+  box-shadow: inset 0 0 0 1px rgba(255,255,255,.02);
+}
+.datechip .cal{width:10px; height:10px; background:var(--lime); border-radius:2px;
+  box-shadow:0 0 10px rgba(164,219,50,.6); display:inline-block; position:relative}
+.datechip .cal:before{
+  content:""; position:absolute; left:-2px; top:-2px; width:14px; height:3px;
+  background:var(--lime); border-radius:3px; opacity:.9;
+}
+
+/* slimmer slider line + lime handle */
+[data-baseweb="slider"] div[role="slider"]{ background: var(--lime) !important; }
+[data-baseweb="slider"] div[data-testid="stSliderThumbValue"]{ color: var(--text) !important; }
+
+
+</style>
+"""
+
+
+def inject_styles():
+    st.markdown(STYLES, unsafe_allow_html=True)
+
+
+def pill(number, label, sub=None, state="neutral"):
+    cls = "pill" + (" positive" if state=="pos" else " negative" if state=="neg" else "")
+    sub_html = f'<div class="sub">{sub}</div>' if sub else ""
+    return f'<div class="{cls}"><div class="label">{label}</div><div class="value">{number}</div>{sub_html}</div>'
+
+
+@st.cache_data(show_spinner="Crunching orders…", max_entries=8)
+def load_upload(digests: tuple, cost_version: str, _datas: list, _profile: pnl_engine.StoreProfile,
+                measure_memory: bool = False):
+    """
+    Parse one or more uploads and build their per-order facts: (facts, first
+    date, last date, duplicate lines dropped, stage timings). Cached on the
+    files' content hashes + cost-table version, so ad spend / FX / toggle
+    reruns skip all of it; across restarts the Parquet sidecar cache
+    (sidecar.py) skips the parse. The timings are those of that first load,
+    for the Performance panel.
+    """
+    timer = pnl_engine.StageTimer(_profile.key, memory=measure_memory)
+    facts, dmin, dmax, dupes = sidecar.load_uploads(_datas, _profile, digests=digests, timer=timer)
+    return facts, dmin, dmax, dupes, timer.records
+
+
+@st.cache_data(max_entries=8)
+def order_index(digests: tuple, cost_version: str, fx_version: str, _facts: pd.DataFrame, _fx_table):
+    """
+    The upload's sorted order-date index and order cube (priced with the FX
+    table, fx_rates.py), built once per upload and table like the facts.
+    """
+    return pnl_engine.DateIndex(_facts), pnl_engine.OrderCube.from_facts(_facts, _fx_table)
+
+
+def date_filter(digests: tuple, cost_version: str, facts: pd.DataFrame, dmin, dmax, timer: pnl_engine.StageTimer):
+    """
+    Date range slider over the upload's order dates: (facts, cube, first
+    date, last date) of the selected range. The full range returns the
+    upload unchanged, undated orders included.
+    """
+    fx_table = fx_rates.default_table()
+    index, cube = order_index(digests, cost_version, fx_rates.version(fx_table), facts, fx_table)
+    if len(index) == 0 or index.first == index.last:
+        return facts, cube, dmin, dmax
+    lo, hi = index.first.date(), index.last.date()
+    start, end = st.slider("Date range", min_value=lo, max_value=hi, value=(lo, hi), format="MMM DD, YYYY")
+    if (start, end) == (lo, hi):
+        return facts, cube, dmin, dmax
+    with timer.stage("filter_dates", rows=timer.rows, orders=len(facts)) as rec:
+        facts, dmin, dmax = index.select(facts, start, end)
+        cube = cube.where(start, end)
+        rec["orders"] = len(facts)
+    if facts.empty:
+        st.caption("No orders in this date range.")
+    return facts, cube, dmin, dmax
+
+
+def upload_digests(files) -> tuple:
+    """
+    Content hashes of the uploaded files, each hashed once per upload (keyed
+    by Streamlit's file_id) rather than on every widget rerun.
+    """
+    seen = st.session_state.get("upload_digests", {})
+    digests = {f.file_id: seen.get(f.file_id) or pnl_engine.content_hash(f) for f in files}
+    st.session_state["upload_digests"] = digests
+    return tuple(digests[f.file_id] for f in files)
+
+
+CURRENCY_SIGNS = {"GBP": "£", "USD": "$", "EUR": "€"}
+
+
+def amounts(by_currency: pd.Series) -> str:
+    """Amounts per currency (pnl_engine.revenue_by_currency) as one line: "£1,234.00 + €56.00"."""
+    if by_currency.empty:
+        return "0.00"
+    return " + ".join(f"{CURRENCY_SIGNS[c]}{v:,.2f}" if c in CURRENCY_SIGNS else f"{v:,.2f} {c}"
+                      for c, v in by_currency.items())
+
+
+def unconverted_warning(cube: pnl_engine.OrderCube, profile: pnl_engine.StoreProfile):
+    """Warn about orders in another currency converted at the manual rate because the FX table has no rate for them."""
+    missing = cube.unconverted_orders(profile)
+    if missing.sum():
+        per = ", ".join(f"{n:,} {c}" for c, n in missing.items())
+        st.warning(f"{int(missing.sum()):,} orders ({per}) have no rate in the FX table (fx_rates.py) and are "
+                   "converted at the manual rate. Add their currencies' rates to convert them exactly.")
+
+
+def files_chip(n_files: int, dupes: int) -> str:
+    """Header chip for a multi-file upload (empty for a single file)."""
+    if n_files < 2:
+        return ""
+    return (f'<span class="fxchip"><span class="dot"></span> {n_files} files merged · '
+            f'{dupes:,} overlapping line item{"" if dupes == 1 else "s"} dropped</span>')
+
+
+def copy_button(text: str, label: str):
+    """A button that copies `text` to the clipboard (tiny HTML component)."""
+    # Safer to embed via JSON (handles quotes etc.)
+    _payload = _json.dumps(text)
+    _st_html(f"""
+      <button id="copyBtn" style="
+        padding:10px 14px;border:1px solid #A4DB32;border-radius:10px;
+        background:transparent;color:#e5e7eb;cursor:pointer;font-weight:700">
+        {label}
+      </button>
+      <script>
+        const data = {_payload};
+        const btn = document.getElementById('copyBtn');
+        btn.addEventListener('click', async () => {{
+          try {{
+            await navigator.clipboard.writeText(data);
+            const old = btn.innerText;
+            btn.innerText = 'Copied!';
+            setTimeout(()=>btn.innerText = old, 1200);
+          }} catch (e) {{
+            alert('Copy failed: ' + e);
+          }}
+        }});
+      </script>
+    """, height=70)
+
+
+def quick_paste(export_row: dict, heading: str, file_name: str):
+    """Preview, copy-to-clipboard button and TSV download for the one-row P&L summary."""
+    headers = list(export_row)
+    tsv_line = pnl_engine.summary_tsv(export_row)
+
+    st.markdown(f"#### {heading}")
+    st.caption("Click copy, then ⌘V / Ctrl+V into your Google Sheet (TSV format).")
+    # Pretty preview table in the app (doesn't affect clipboard TSV)
+    preview_df = pd.DataFrame([{
+        k: (v if k == "Date (or range)" else f"${v:.2f}") for k, v in export_row.items()
+    }])[headers]
+    st.dataframe(preview_df, use_container_width=True, hide_index=True)
+
+    copy_button(tsv_line, "📋 Copy row for Sheets")
+
+    # Optional: also offer a TSV download file
+    _buf = _StringIO()
+    _buf.write("\t".join(headers) + "\n" + tsv_line)
+    st.download_button(
+        "⬇️ Download TSV",
+        data=_buf.getvalue().encode("utf-8"),
+        file_name=file_name,
+        mime="text/tab-separated-values",
+    )
+
+
+def pnl_series(cube: pnl_engine.OrderCube, profile: pnl_engine.StoreProfile, ad_spend_usd: float, file_name: str,
+               fx: float = 1.0):
+    """Per-day / per-ISO-week P&L block (pnl_engine.pnl_series) to paste a whole period at once."""
+    days = cube.days
+    with st.expander("Daily / weekly P&L (paste a whole period)"):
+        if days.empty:
+            st.caption("No order dates found in this upload.")
+            return
+        c1, c2 = st.columns(2)
+        freq = c1.radio("Rows per", ["Day", "ISO week"], horizontal=True)
+        spend_mode = c2.radio("Ad spend", ["Spread evenly over the days", "Enter per day"], horizontal=True)
+
+        ad_spend = ad_spend_usd
+        if spend_mode == "Enter per day":
+            per_day = st.data_editor(
+                pd.DataFrame({"Date": days.date, "Ad Spend (USD)": 0.0}),
+                disabled=["Date"], hide_index=True, use_container_width=True,
+            )
+            ad_spend = pd.Series(per_day["Ad Spend (USD)"].fillna(0.0).to_numpy(dtype=float), index=days)
+
+        table = pnl_engine.pnl_series(cube, profile, fx, "W" if freq == "ISO week" else "D", ad_spend)
+        st.dataframe(table, use_container_width=True, hide_index=True)
+        undated = cube.undated
+        if undated:
+            st.caption(f"{undated:,} orders without a date are not in these rows.")
+
+        tsv = pnl_engine.series_tsv(table)
+        copy_button(tsv.split("\n", 1)[1], "📋 Copy rows for Sheets")
+        st.download_button("⬇️ Download TSV", data=tsv.encode("utf-8"), file_name=file_name,
+                           mime="text/tab-separated-values")
+
+
+def record_history(digests: tuple, datas: list, profile: pnl_engine.StoreProfile, facts: pd.DataFrame,
+                   timer: pnl_engine.StageTimer) -> int:
+    """
+    Append the uploads to the local warehouse when it is on (PNL_WAREHOUSE),
+    as its own "warehouse_append" stage: the number of new orders stored.
+    Runs on every rerun, not from a cache, so a replaced database file is
+    refilled. When all of the upload's orders (`facts`) are stored already,
+    only their Names are checked, nothing is parsed.
+    """
+    wh = warehouse.default_warehouse()
+    if wh is None:
+        return 0
+    with timer.stage("warehouse_append", rows=timer.rows, orders=len(facts)) as rec:
+        added = 0
+        if wh.missing(profile.key, facts["Order ID"]):
+            with st.spinner("Adding orders to the history…"):
+                cache = sidecar.default_cache()
+                added = sum(wh.append_upload(data, profile, digest=digest, cache=cache)
+                            for digest, data in zip(digests, datas))
+        rec["added"] = added
+    return added
+
+
+def history(profile: pnl_engine.StoreProfile, added: int, fx: float = 1.0):
+    """
+    Month / quarter / year P&L over every upload so far (warehouse.py), with
+    year-over-year revenue; `added` is record_history()'s count for this run.
+    """
+    wh = warehouse.default_warehouse()
+    if wh is None:
+        return
+    first, last, stored = wh.span(profile.key)
+    with st.expander("History (all uploads so far)"):
+        if first is None:
+            st.caption("No dated orders stored yet.")
+            return
+        c1, c2 = st.columns(2)
+        period = c1.radio("Rows per", ["Month", "Quarter", "Year"], horizontal=True, key="history_period")
+        picked = c2.date_input("Range", value=(first.date(), last.date()), min_value=first.date(),
+                               max_value=last.date(), key="history_range")
+        start, end = (picked if len(picked) == 2 else (picked[0], picked[0])) if picked else (None, None)
+        table = wh.pnl(profile, period.lower(), start, end, fx, fx_rates.default_table())
+        st.dataframe(table, use_container_width=True, hide_index=True)
+        note = f"{stored:,} orders stored" + (f", {added:,} new from this upload." if added else
+                                              ", this upload's included.")
+        stale = wh.stale(profile)
+        if stale:
+            note += f" {stale:,} were priced with older cost tables; re-upload them to refresh their COGS."
+        st.caption(note)
+
+
+def reconciliation(rec: dict):
+    """Render the Reconciliation section from pnl_engine.reconciliation_tables()."""
+    total_orders, computed_orders = rec["total_orders"], rec["computed_orders"]
+
+    st.markdown('<div class="hr"></div>', unsafe_allow_html=True)
+    st.markdown("### Reconciliation")
+
+    r_recon = [
+        pill(f"{total_orders}", "Total Orders (in CSV)"),
+        pill(f"{computed_orders}", "Orders with Priced COGS", sub=f"{computed_orders}/{total_orders}"),
+    ]
+    st.markdown('<div class="row-2">' + "".join(r_recon) + '</div>', unsafe_allow_html=True)
+
+    # Show any orders we couldn't price
+    if not rec["unpriced"].empty:
+        with st.expander("⚠️ Orders without priced COGS (click to review)"):
+            st.dataframe(rec["unpriced"], use_container_width=True, hide_index=True)
+
+    st.markdown("#### Orders per Country")
+    st.dataframe(rec["country_counts"], use_container_width=True, hide_index=True)
+
+    if not rec["warnings"].empty:
+        with st.expander("⚠️ Orders with warnings (extrapolated or unusual)"):
+            st.dataframe(rec["warnings"], use_container_width=True, hide_index=True)
+
+    # Per-country toggles
+    for ctry, cnt, subset in rec["per_country"]:
+        with st.expander(f"{ctry} — {cnt} orders"):
+            st.dataframe(subset, use_container_width=True, hide_index=True)
+
+
+CACHED_STAGES = {
+    "parquet cache", "parse", "merge_uploads", "extract_date_series", "calc_cogs (blended)", "stream_orders",
+}
+
+
+def performance_panel(timer: pnl_engine.StageTimer):
+    """The optional "Performance" expander: one row per stage of this run."""
+    with st.expander("Performance", expanded=True):
+        perf = pd.DataFrame(timer.records)
+        perf["stage"] = [f"{s} (cached)" if s in CACHED_STAGES else s for s in perf["stage"]]
+        st.dataframe(
+            perf.rename(columns={
+                "stage": "Stage", "seconds": "Wall time (s)", "peak_mib": "Peak memory (MiB)",
+                "peak_scope": "Peak of", "rows": "Rows", "rows_per_sec": "Rows/s", "orders": "Orders",
+            }).reindex(columns=["Stage", "Wall time (s)", "Peak memory (MiB)", "Peak of", "Rows", "Rows/s", "Orders"]),
+            use_container_width=True, hide_index=True,
+        )
+        st.caption("Cached stages show the figures of the first load of this upload. "
+                   "Peak memory is the tracemalloc peak within each stage; turning the panel "
+                   "on re-measures the upload once with memory tracing. Tracing is process-wide, so "
+                   "a stage that overlapped another session's shows the process's peak (\"process\").")
@@ -0,0 +1,265 @@
+"""
+Local order warehouse: every upload's orders kept in one SQLite file.
+
+Each upload is appended once per order Name: orders already stored for the
+store are skipped before anything is classified, so a re-upload or an
+overlapping export only prices its new orders. Stored orders keep their
+per-order figures (revenue in the export's currency, main / extras COGS,
+country, order type) and their line items keep the zero-COGS / main / extra
+classification, so any historical range, by month, quarter or year, is one
+SQL aggregate instead of reloading months of CSVs.
+
+    PNL_WAREHOUSE   database file, or "on" for ~/.cache/pnl_dashboards/orders.sqlite
+                    (unset or "off": no warehouse)
+
+Orders keep the cost-table version they were priced with; reload them
+after a price change to refresh their COGS. Revenue converts to USD when
+queried, at the daily FX table's rate for each day and currency
+(fx_rates.py) or the manual rate.
+"""
+import os
+import sqlite3
+import time
+from contextlib import closing, contextmanager
+
+import numpy as np
+import pandas as pd
+
+import pnl_engine
+import sidecar
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "pnl_dashboards", "orders.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    store TEXT NOT NULL,
+    name TEXT NOT NULL,
+    day TEXT,                       -- YYYY-MM-DD, NULL when the export had no date
+    raw_country TEXT,
+    country TEXT,
+    order_type TEXT NOT NULL,       -- recurring / first / one-off
+    gateway TEXT NOT NULL DEFAULT '', -- "Payment Method", prices the fees
+    currency TEXT NOT NULL DEFAULT '', -- "Currency", "" when the export had none
+    revenue_cents INTEGER NOT NULL, -- in that currency
+    main_units INTEGER NOT NULL,
+    main_cost_cents INTEGER NOT NULL,
+    extras_cost_cents INTEGER NOT NULL,
+    cogs_cents INTEGER NOT NULL,
+    computed INTEGER NOT NULL,
+    status TEXT,
+    warnings TEXT,
+    unmapped TEXT,
+    cost_version TEXT NOT NULL,
+    loaded_at TEXT NOT NULL,
+    PRIMARY KEY (store, name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS orders_by_day ON orders (store, day);
+CREATE TABLE IF NOT EXISTS lines (
+    store TEXT NOT NULL,
+    name TEXT NOT NULL,
+    item TEXT,
+    quantity INTEGER,
+    price REAL,
+    kind TEXT NOT NULL,             -- zero / main / extra / unmapped
+    extra_key TEXT
+);
+CREATE INDEX IF NOT EXISTS lines_by_order ON lines (store, name);
+"""
+
+# SQL for the period label of an order day
+PERIODS = {
+    "day": "day",
+    "month": "substr(day, 1, 7)",
+    "quarter": "substr(day, 1, 4) || '-Q' || ((CAST(substr(day, 6, 2) AS INTEGER) + 2) / 3)",
+    "year": "substr(day, 1, 4)",
+}
+
+ORDER_COLS = [
+    "store", "name", "day", "raw_country", "country", "order_type", "gateway", "currency", "revenue_cents",
+    "main_units", "main_cost_cents", "extras_cost_cents", "cogs_cents", "computed", "status", "warnings", "unmapped",
+    "cost_version", "loaded_at",
+]
+
+# columns added since the first files were written: (name, declaration)
+ADDED_COLS = [
+    ("gateway", "TEXT NOT NULL DEFAULT ''"),
+    ("currency", "TEXT NOT NULL DEFAULT ''"),
+]
+
+# totals per period, day, gateway and currency; fees are charged per order at
+# the gateway's rates, revenue converts at the day's rate for the currency
+PERIOD_SQL = """
+SELECT {period} AS period,
+       day,
+       gateway,
+       currency,
+       COUNT(*) AS orders,
+       SUM(computed) AS computed,
+       SUM(main_units) AS main_units,
+       SUM(revenue_cents) AS revenue,
+       SUM(cogs_cents) AS cogs,
+       SUM(order_type != 'recurring') AS nc_orders,
+       SUM(CASE WHEN order_type != 'recurring' THEN revenue_cents ELSE 0 END) AS nc_revenue,
+       SUM(CASE WHEN order_type != 'recurring' THEN cogs_cents ELSE 0 END) AS nc_cogs
+FROM orders
+WHERE store = ? AND day IS NOT NULL AND day >= ? AND day <= ?
+GROUP BY period, day, gateway, currency
+ORDER BY period, day, gateway, currency
+"""
+
+
+class Warehouse:
+    """One SQLite file of orders and classified line items, keyed by (store, order Name)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as con:
+            con.executescript(SCHEMA)
+            have = {row[1] for row in con.execute("PRAGMA table_info(orders)")}
+            for name, decl in ADDED_COLS:
+                if name not in have:
+                    # files written before orders kept this column
+                    con.execute(f"ALTER TABLE orders ADD COLUMN {name} {decl}")
+
+    @contextmanager
+    def _connect(self):
+        with closing(sqlite3.connect(self.path, timeout=30)) as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            with con:  # one transaction
+                yield con
+
+    def _known(self, con, store: str, names) -> set:
+        con.execute("CREATE TEMP TABLE IF NOT EXISTS upload_names (name TEXT PRIMARY KEY)")
+        con.execute("DELETE FROM upload_names")
+        con.executemany("INSERT OR IGNORE INTO upload_names VALUES (?)", ((n,) for n in names))
+        rows = con.execute(
+            "SELECT u.name FROM upload_names u JOIN orders o ON o.store = ? AND o.name = u.name", (store,))
+        return {name for name, in rows}
+
+    def append(self, lines: pd.DataFrame, profile: pnl_engine.StoreProfile) -> int:
+        """Store the orders of `lines` not stored yet for the profile's store; returns how many."""
+        names = lines["Name"].dropna().astype(str)
+        with self._connect() as con:
+            known = self._known(con, profile.key, names.unique())
+            new = lines.loc[names.index[~names.isin(known)]]
+            if new.empty:
+                return 0
+            facts, _, _ = pnl_engine.orders_from_lines(new, profile)
+            cls = pnl_engine.classify_lines(new["Lineitem name"], profile.cogs)
+
+            version, stamp = pnl_engine.table_version(profile), time.strftime("%Y-%m-%dT%H:%M:%S")
+            con.executemany(
+                f"INSERT OR IGNORE INTO orders ({', '.join(ORDER_COLS)}) VALUES ({', '.join('?' * len(ORDER_COLS))})",
+                zip(
+                    [profile.key] * len(facts), facts["Order ID"].astype(str),
+                    facts["Date"].where(facts["Date"] != "", None), facts["Raw Country"].astype(str),
+                    facts["Country"].astype(str), pnl_engine.order_types(facts), facts["Gateway"].astype(str),
+                    facts["Currency"].astype(str), pnl_engine.to_cents(facts["Revenue"]).tolist(),
+                    facts["Main Units"].astype(int).tolist(), pnl_engine.to_cents(facts["Main Cost (USD)"]).tolist(),
+                    pnl_engine.to_cents(facts["Extras Cost (USD)"]).tolist(),
+                    pnl_engine.to_cents(facts["Total COGS (USD)"]).tolist(), facts["Computed?"].astype(int).tolist(),
+                    facts["Status"], facts["Warnings"], facts["Unmapped Lines"],
+                    [version] * len(facts), [stamp] * len(facts),
+                ),
+            )
+            kind = np.select([cls["zero"], cls["main"], cls["extra"].notna()], ["zero", "main", "extra"], "unmapped")
+            qty = pd.to_numeric(new["Lineitem quantity"], errors="coerce").fillna(0).astype(int)
+            price = pd.to_numeric(new["Lineitem price"], errors="coerce") if "Lineitem price" in new else np.nan
+            lines_out = pd.DataFrame({
+                "store": profile.key, "name": new["Name"].astype(str), "item": new["Lineitem name"].astype(str),
+                "quantity": qty, "price": price, "kind": kind, "extra_key": cls["extra"],
+            }).loc[new["Name"].notna()]
+            con.executemany(
+                "INSERT INTO lines VALUES (?, ?, ?, ?, ?, ?, ?)",
+                lines_out.astype(object).where(lines_out.notna(), None).itertuples(index=False, name=None),
+            )
+        return len(facts)
+
+    def missing(self, store: str, names) -> int:
+        """How many of the distinct order `names` are not stored yet for the store."""
+        names = pd.unique(pd.Series(names, dtype=object).dropna().astype(str))
+        with self._connect() as con:
+            return len(names) - len(self._known(con, store, names))
+
+    def append_upload(self, data, profile: pnl_engine.StoreProfile, *, digest=None, cache=None) -> int:
+        """Append one upload (streamed in chunks of whole orders when it is big); returns new orders stored."""
+        if pnl_engine.upload_size(data) >= pnl_engine.STREAM_MIN_BYTES:
+            cfg = profile.cogs
+            chunks = pnl_engine.iter_order_chunks(pnl_engine.open_upload(data), country_cols=cfg.country_cols,
+                                                  date_cols=profile.date_cols, revenue_cols=cfg.revenue_cols)
+            return sum(self.append(chunk, profile) for chunk in chunks)
+        return self.append(sidecar.load_lines(data, profile, digest=digest, cache=cache), profile)
+
+    def span(self, store: str):
+        """(first day, last day, orders) stored for a store; days are None without dated orders."""
+        with self._connect() as con:
+            first, last, n = con.execute(
+                "SELECT MIN(day), MAX(day), COUNT(*) FROM orders WHERE store = ?", (store,)).fetchone()
+        return (pd.Timestamp(first) if first else None), (pd.Timestamp(last) if last else None), n
+
+    def stale(self, profile: pnl_engine.StoreProfile) -> int:
+        """Stored orders priced with other cost tables than the profile's current ones."""
+        with self._connect() as con:
+            return con.execute("SELECT COUNT(*) FROM orders WHERE store = ? AND cost_version != ?",
+                               (profile.key, pnl_engine.table_version(profile))).fetchone()[0]
+
+    def periods(self, store: str, period: str = "month", start=None, end=None) -> pd.DataFrame:
+        """SQL totals per period, day, gateway and currency (cents in that currency for revenue, USD for COGS)."""
+        lo = pd.Timestamp(start).strftime("%Y-%m-%d") if start is not None else "0000-00-00"
+        hi = pd.Timestamp(end).strftime("%Y-%m-%d") if end is not None else "9999-99-99"
+        with self._connect() as con:
+            return pd.read_sql_query(PERIOD_SQL.format(period=PERIODS[period]), con, params=(store, lo, hi))
+
+    def pnl(self, profile: pnl_engine.StoreProfile, period: str = "month", start=None, end=None,
+            fx: float = 1.0, fx_table=None) -> pd.DataFrame:
+        """
+        Revenue, fees, COGS and gross profit per period from the stored orders,
+        with the revenue change against the same period a year earlier. Orders
+        in another currency without an FX rate convert at `fx` (see
+        pnl_engine.usd_totals) and are counted in "Orders without FX rate"
+        when there are any.
+        """
+        rows = self.periods(profile.key, period, start, end).rename(columns={"gateway": "Gateway",
+                                                                              "currency": "Currency"})
+        rows["FX Rate"] = pnl_engine.usd_rates(pd.to_datetime(rows["day"]), rows["Currency"], fx_table)
+        usd, nc_usd = (
+            pnl_engine.usd_totals(rows.rename(columns={rev: "Revenue", n: "Orders"}), profile, fx, by="period")
+            for rev, n in (("revenue", "orders"), ("nc_revenue", "nc_orders"))
+        )
+        missing = pnl_engine.unconverted_orders(rows.rename(columns={"orders": "Orders"}), profile, by="period")
+        p = rows.drop(columns=["day", "Gateway", "Currency", "FX Rate"]).groupby("period", as_index=False).sum()
+        revenue, fees = usd["Revenue (USD)"].to_numpy(), usd["Fees (USD)"].to_numpy()
+        nc_revenue, nc_fees = nc_usd["Revenue (USD)"].to_numpy(), nc_usd["Fees (USD)"].to_numpy()
+        cogs, nc_cogs = p["cogs"] / 100, p["nc_cogs"] / 100
+        prior = p["period"].str.slice(0, 4).astype(int).sub(1).astype(str) + p["period"].str.slice(4)
+        prior_revenue = prior.map(dict(zip(p["period"], revenue)))
+        out = pd.DataFrame({
+            period.capitalize(): p["period"],
+            "Orders": p["orders"],
+            "Revenue (USD)": revenue,
+            "Fees (USD)": fees,
+            "Total Revenue (USD)": revenue - fees,
+            "Total COGs (USD)": cogs,
+            "Gross Profit (USD)": revenue - fees - cogs,
+            "NC Orders": p["nc_orders"],
+            "NC Revenue (USD)": nc_revenue,
+            "NC Gross Profit (USD)": nc_revenue - nc_fees - nc_cogs,
+            "Revenue vs prior year": (revenue / prior_revenue - 1).where(prior_revenue > 0),
+        })
+        if len(missing):
+            out["Orders without FX rate"] = p["period"].map(missing).fillna(0).astype(int)
+        return out.round(2)
+
+
+def default_warehouse() -> Warehouse | None:
+    """The warehouse configured by the environment, or None when it is off (the default) or can't be opened."""
+    path = os.environ.get("PNL_WAREHOUSE", "")
+    if path.lower() in ("", "off"):
+        return None
+    if path.lower() == "on":
+        path = DEFAULT_PATH
+    try:
+        return Warehouse(path)
+    except (OSError, sqlite3.Error):
+        return None